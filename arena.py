@@ -0,0 +1,237 @@
+"""The Deal graph held in preallocated NumPy arrays, one row per state, rather than as Deal objects.
+
+A Deal in cache, with its Rules, Shoe, two Hands and dicts of child states, costs well over a kilobyte;
+a state here is a row in a few arrays, plus a slot in the index of rows by state key:
+    Nodes       key_hi, key_lo      state key (see state_key.py), high and low 64 bits
+                parent              row of the state first expanded to reach it (-1 for a root)
+                action              code (index into actions) of the action leading from parent
+                edge_start/count    its edges to child states, a contiguous block of the edge arrays
+                value, nodes        valuation: best action's value, and node count as in Deal.valuation
+                status              UNEXPANDED, EXPANDED (edges known) or VALUED
+    Edges       child, action, card (index into config.card_symbols; -1 for none), prob
+    Index       slots               row by hash of state key (-1 for none), an open-addressing table:
+                                    a key is looked for from its hash slot on, until found or a free slot
+States reached by transposition (e.g. 6 then T vs. T then 6) share one row, as they share one Deal in cache.
+
+States are rows, referred to by row index. expand(i) works out a state's edges (or, for a leaf or a state
+at the Dealer's turn, its value) using a Deal for the state, made from its key and released at once,
+so no Deal objects stay in memory. value(i) values a state and everything below it, expanding as needed,
+with an explicit stack, as Deal.valuation does; valuation(i) gives the result in Deal.valuation format.
+Valuation is exact (Deal.prune_reach and Deal.bound_actions don't apply), and states aren't saved or loaded.
+Arrays grow by doubling when full; the index, when over half full, with every row placed again.
+"""
+import sys
+
+import numpy as np
+
+from config import card_indexes, log, log_occasional
+from deal import Deal
+from state_key import decode
+
+
+actions = ['Deal', 'Turn', 'Surrender', 'Split', 'Double', 'Hit', 'Stand']
+UNEXPANDED, EXPANDED, VALUED = range(3)
+low_mask = (1 << 64) - 1
+hash_multiplier = 0x9E3779B97F4A7C15       # 2^64 / golden ratio, odd: spreads keys over slots (Fibonacci hashing)
+
+
+class Arena:
+    def __init__(self, capacity=1 << 20):
+        self.size = 0               # Nodes in use
+        self.edge_size = 0          # Edges in use
+        self.slots = np.full(2 * capacity, -1, dtype=np.int64)      # Index of rows by state key (see find)
+        self.key_hi = np.zeros(capacity, dtype=np.uint64)
+        self.key_lo = np.zeros(capacity, dtype=np.uint64)
+        self.parent = np.zeros(capacity, dtype=np.int64)
+        self.action = np.zeros(capacity, dtype=np.int8)
+        self.edge_start = np.zeros(capacity, dtype=np.int64)
+        self.edge_count = np.zeros(capacity, dtype=np.int32)
+        self.value_ = np.zeros(capacity, dtype=np.float64)
+        self.nodes = np.zeros(capacity, dtype=np.int64)
+        self.status = np.zeros(capacity, dtype=np.int8)
+        self.child = np.zeros(capacity, dtype=np.int64)
+        self.edge_action = np.zeros(capacity, dtype=np.int8)
+        self.card = np.zeros(capacity, dtype=np.int8)
+        self.prob = np.zeros(capacity, dtype=np.float64)
+
+    @property
+    def nbytes(self):
+        """Bytes of array storage allocated."""
+        return sum(a.nbytes for a in vars(self).values() if isinstance(a, np.ndarray))
+
+    def add(self, deal, parent=-1, action=-1):
+        """Return row of deal's state, adding it (unexpanded) if new."""
+        i, slot = self.find(deal.key)
+        if i >= 0:
+            return i
+        if self.size == len(self.status):
+            self.grow_nodes()
+        if 2 * (self.size + 1) > len(self.slots):
+            self.grow_slots()
+            slot = self.find(deal.key)[1]
+        i = self.size
+        self.size += 1
+        self.slots[slot] = i
+        self.key_hi[i] = deal.key >> 64
+        self.key_lo[i] = deal.key & low_mask
+        self.parent[i] = parent
+        self.action[i] = action
+        self.edge_count[i] = 0
+        self.status[i] = UNEXPANDED
+        return i
+
+    def children(self, i):
+        """Return edges of row i, as arrays: child rows, action codes, card indexes, probabilities."""
+        edges = slice(self.edge_start[i], self.edge_start[i] + self.edge_count[i])
+        return self.child[edges], self.edge_action[edges], self.card[edges], self.prob[edges]
+
+    def deal(self, i):
+        """A Deal for the state in row i (cached as usual; release it when done)."""
+        rules, dealer, player, true_count = decode(self.key(i))
+        return Deal(rules=rules, dealer=dealer, player=player, true_count=true_count)
+
+    def expand(self, i):
+        """Work out row i's edges, adding child states as needed; or its value, if it's known without them.
+            A new child's value is taken now, if it's known without children of its own, while its Deal is at hand.
+        """
+        if self.status[i] != UNEXPANDED:
+            return
+        deal = self.deal(i)
+        if not self.settle(i, deal):
+            edges = []
+            for action, card, prob, child in deal.iter_next_states():
+                code = actions.index(action)
+                size = self.size
+                c = self.add(child, i, code)
+                if c == size:
+                    self.settle(c, child)
+                edges.append((c, code, card_indexes.get(card, -1), prob))
+                child.release()
+            while self.edge_size + len(edges) > len(self.child):
+                self.grow_edges()
+            start = self.edge_size
+            for j, (c, code, card, prob) in enumerate(edges, start):
+                self.child[j] = c
+                self.edge_action[j] = code
+                self.card[j] = card
+                self.prob[j] = prob
+            self.edge_start[i] = start
+            self.edge_count[i] = len(edges)
+            self.edge_size += len(edges)
+            self.status[i] = EXPANDED
+        deal.release()
+
+    def find(self, key):
+        """Return row of the state with key (-1 if none), and the slot it's in, or would go in."""
+        hi, lo = key >> 64, key & low_mask
+        mask = len(self.slots) - 1
+        slot = slot_of(hi, lo, mask)
+        while True:
+            i = int(self.slots[slot])
+            if i < 0 or (int(self.key_lo[i]) == lo and int(self.key_hi[i]) == hi):
+                return i, slot
+            slot = (slot + 1) & mask
+
+    def grow_edges(self):
+        for name in ['child', 'edge_action', 'card', 'prob']:
+            setattr(self, name, grown(getattr(self, name)))
+
+    def grow_slots(self):
+        self.slots = np.full(2 * len(self.slots), -1, dtype=np.int64)
+        mask = len(self.slots) - 1
+        for i, (hi, lo) in enumerate(zip(self.key_hi[:self.size].tolist(), self.key_lo[:self.size].tolist())):
+            slot = slot_of(hi, lo, mask)
+            while self.slots[slot] >= 0:
+                slot = (slot + 1) & mask
+            self.slots[slot] = i
+
+    def grow_nodes(self):
+        for name in ['key_hi', 'key_lo', 'parent', 'action', 'edge_start', 'edge_count', 'value_', 'nodes', 'status']:
+            setattr(self, name, grown(getattr(self, name)))
+
+    def key(self, i):
+        return int(self.key_hi[i]) << 64 | int(self.key_lo[i])
+
+    def settle(self, i, deal):
+        """If deal's value is known without child states (a leaf, at the Dealer's turn, or a post-split hand
+            with Deal.decompose_splits), set it as row i's value.
+            Return whether it was.
+        """
+        leaf = deal.valuation_leaf
+        known = [leaf] if leaf is not None else deal.dealer_valuation or deal.split_valuation
+        if known is None:
+            return False
+        self.value_[i] = known[0]['value']
+        self.nodes[i] = known[0]['nodes']
+        self.status[i] = VALUED
+        return True
+
+    def totals(self, i):
+        """Return dict of [value, nodes] by action code, for row i, all of whose children are valued."""
+        totals = {}
+        child, action, card, prob = self.children(i)
+        for v, n, a, p in zip(self.value_[child].tolist(), self.nodes[child].tolist(), action.tolist(), prob.tolist()):
+            t = totals.setdefault(a, [0.0, 0])
+            t[0] += p * v
+            t[1] += n
+        return totals
+
+    def value(self, i):
+        """Value row i and all states below it not yet valued; return its value."""
+        stack = [i]
+        while stack:
+            j = stack[-1]
+            if self.status[j] == VALUED:
+                stack.pop()
+                continue
+            self.expand(j)
+            if self.status[j] == VALUED:
+                stack.pop()
+                continue
+            child = self.children(j)[0]
+            todo = child[self.status[child] != VALUED]
+            if len(todo):
+                stack.extend(np.unique(todo).tolist())
+                continue
+            value, nodes = max(self.totals(j).values(), key=lambda t: t[0])
+            self.value_[j] = value
+            self.nodes[j] = nodes
+            self.status[j] = VALUED
+            stack.pop()
+            log_occasional(f'Arena: {self.size} states, {self.edge_size} edges', seconds=10)
+        return float(self.value_[i])
+
+    def valuation(self, i):
+        """Value row i; return its valuation by action, best first, as Deal.valuation does."""
+        self.value(i)
+        if self.edge_count[i] == 0:
+            # Known without child states: Deal.valuation's result, with action None for a leaf (no action left)
+            deal = self.deal(i)
+            results = [{'action': None, **v} for v in deal.valuation]
+            deal.release()
+            return results
+        results = [
+            {'action': actions[a], 'value': value, 'nodes': nodes}
+            for a, (value, nodes) in self.totals(i).items()
+        ]
+        return sorted(results, key=lambda r: r['value'], reverse=True)
+
+
+def slot_of(hi, lo, mask):
+    """Slot in an index of mask + 1 slots (a power of 2) at which to start looking for state key hi, lo."""
+    return ((((hi * hash_multiplier) ^ lo) * hash_multiplier) & low_mask) >> (64 - mask.bit_length())
+
+
+def grown(a):
+    b = np.zeros(2 * len(a), dtype=a.dtype)
+    b[:len(a)] = a
+    return b
+
+
+if __name__ == '__main__':
+    cards = sys.argv[1] if len(sys.argv) > 1 else ''
+    arena = Arena()
+    root = arena.add(Deal.from_cards(cards, rules=(1.5, 6, True, 'Any2', 3, True, False, True)))
+    val = arena.valuation(root)
+    log(f'{arena.deal(root)}: {val}')
+    log(f'{arena.size} states, {arena.edge_size} edges, {arena.nbytes / 1e6:.1f} MB in arrays')
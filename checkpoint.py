@@ -0,0 +1,94 @@
+"""Snapshots of a long Deal.valuation run, so that a restarted run resumes where it stopped.
+
+When a compute process exits for restart (see Deal.manage_cache) or is killed, valuations held only in memory
+are lost, and the restarted run would expand the tree again from the root. With Deal.checkpoint set,
+each state valued with at least min_nodes nodes is recorded as it's finished (so evicting it from cache
+doesn't lose it), and the record is written every interval seconds, and on exit for restart.
+Snapshots are pickle files, one per rules/true count, replaced whole each time.
+
+Only the frontier is kept: once a state is recorded, the states recorded below it are dropped, as a restarted run
+takes the state's own valuation and never goes below it. States recorded are tracked by depth in Deal.valuation's
+stack for this: those finished while a state is on the stack are below it.
+
+On restart, a Checkpoint for the same root loads the snapshot, and Deal.valuation folds in recorded valuations
+as it comes to their states, so it's soon back where it stopped, at the cost of walking the states above them,
+not of valuing the subtrees already done. States cheaper than min_nodes are just valued again.
+Approximate valuations (see Deal.prune_reach) aren't recorded.
+"""
+import os
+import pickle
+import time
+
+from config import home_dir, log
+from state_key import key_name
+
+
+class Checkpoint:
+    def __init__(self, root, interval=300, min_nodes=1000):
+        self.root = root.key
+        self.fpath = f'{home_dir}/checkpoints/{root.rules}/TC{root.shoe.true_count:+.1f}.pkl'
+        self.interval = interval
+        self.min_nodes = min_nodes
+        self.valuations = {}        # Valuation by state key, for states recorded
+        self.levels = [set()]       # Keys of states recorded, by depth, below the states now on the stack
+        self.stack = []             # Frames of the Deal.valuation run being recorded (set by it)
+        self.last_save = time.monotonic()
+        self.load()
+
+    def get(self, key):
+        """Recorded valuation of the state with key, about to be taken by the state on top of the stack, or None."""
+        val = self.valuations.get(key)
+        if val is not None:
+            self.level(len(self.stack)).add(key)
+        return val
+
+    def level(self, depth):
+        while len(self.levels) <= depth:
+            self.levels.append(set())
+        return self.levels[depth]
+
+    def load(self):
+        if not os.path.isfile(self.fpath):
+            return
+        with open(self.fpath, 'rb') as fp:
+            data = pickle.load(fp)
+        if data['root'] != self.root:
+            log(f'Checkpoint {self.fpath} is for another state ({key_name(data["root"])}); ignored')
+            return
+        self.valuations = data['valuations']
+        log(f'Resuming from checkpoint: {len(self.valuations)} valuations')
+
+    def record(self, deal, val):
+        """Note deal's valuation, just finished, if costly enough, in place of those below it;
+            write a snapshot if one is due. deal's frame has just come off the stack.
+        """
+        depth = len(self.stack)
+        below = set().union(*self.levels[depth + 1:])
+        del self.levels[depth + 1:]
+        if max(v['nodes'] for v in val) >= self.min_nodes and not any(v.get('error') for v in val):
+            for key in below:
+                self.valuations.pop(key, None)
+            self.valuations[deal.key] = val
+            self.level(depth).add(deal.key)
+        else:
+            self.level(depth).update(below)       # Still needed, deal's own valuation not being kept
+        if time.monotonic() - self.last_save >= self.interval:
+            self.save()
+
+    def remove(self):
+        """Drop the snapshot, once the run it's for is done (and its result saved)."""
+        if os.path.isfile(self.fpath):
+            os.remove(self.fpath)
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.fpath), exist_ok=True)
+        data = {
+            'root': self.root,
+            'valuations': self.valuations,
+        }
+        tmp_fpath = f'{self.fpath}.tmp'
+        with open(tmp_fpath, 'wb') as fp:
+            pickle.dump(data, fp, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_fpath, self.fpath)         # Whole, so a kill mid-write leaves the last snapshot
+        self.last_save = time.monotonic()
+        log(f'Checkpoint: {len(self.valuations)} valuations, {len(self.stack)} states deep')
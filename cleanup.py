@@ -5,14 +5,16 @@ import sys
 
 from config import home_dir, log, log_occasional
 from rules import Rules
+from state_key import decode, name_key
 
 
 def preserve(fpath):
     """Preserve starting hands-- the ones we really care about"""
-    toks = fpath[:-5].split(' ')
-    if len(toks[2]) > 4:
+    rules, dealer, player, true_count = decode(name_key(os.path.basename(fpath)[:-5]))
+    if sum(dealer[0]) > 2:
         return False
-    if len(toks) == 4 and len(toks[3]) > 2:
+    counts, surrendered, split_card, split_count, doubled, stand = player
+    if sum(counts) > 2 or surrendered or split_card or doubled or stand:
         return False
     return True
 
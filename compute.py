@@ -1,13 +1,68 @@
 """Run full computations for a variety of scenarios, saving results for summary w/ show_strategy.py
+Jobs (one per rules and true count) run on a pool of worker processes; each job's status, wall time
+and node count are tracked in a job ledger, so an interrupted run resumes where it left off.
+Within a job, valuations are checkpointed (see checkpoint.py), so a restarted job picks up where it stopped.
 FIXME: Non-integer true counts
 """
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime
 from functools import cache
+import json
+import os
+import sys
 
-from config import log_occasional
-from deal import Deal
+from checkpoint import Checkpoint
+from config import home_dir, log, log_occasional
+from deal import Deal, pool_job
 from rules import Rules
 
 
+ledger_fpath = f'{home_dir}/jobs.json'
+
+
+def job_name(rules, true_count):
+    return f'{rules.implied_name} TC{true_count:+.1f}'
+
+
+def load_ledger(retry_failed=False):
+    """Job ledger from a prior run, if any. Jobs left running were interrupted, so are pending again."""
+    if not os.path.isfile(ledger_fpath):
+        return {}
+    with open(ledger_fpath, 'r') as fp:
+        ledger = json.load(fp)
+    for job in ledger.values():
+        if job['status'] == 'running' or (retry_failed and job['status'] == 'failed'):
+            job['status'] = 'pending'
+    return ledger
+
+
+@pool_job
+def run_job(rules, true_count):
+    """Value and save the full Deal for one rules/true count; return summary of wall time and nodes."""
+    start = datetime.now()
+    deal = Deal(rules=rules, true_count=true_count)
+    val = deal.valuation_saved
+    if val is None:
+        Deal.checkpoint = Checkpoint(deal)
+        val = deal.valuation
+        deal.save(save_valuation=True)
+        deal.store.flush()      # Result written before its checkpoint is dropped
+    if Deal.checkpoint is not None:
+        Deal.checkpoint.remove()
+        Deal.checkpoint = None
+    return {
+        'elapsed': (datetime.now() - start).total_seconds(),
+        'nodes': val[0]['nodes'],
+    }
+
+
+def save_ledger(ledger):
+    os.makedirs(os.path.dirname(ledger_fpath), exist_ok=True)
+    with open(ledger_fpath, 'w') as fp:
+        json.dump(ledger, fp, indent=4)
+
+
 @cache
 def true_counts():
     counts = []
@@ -40,15 +95,84 @@ def rules_to_run():
     return rules
 
 
-def run_all_computations():
+def run_all_computations(workers=None, retry_failed=False, max_restarts=10):
+    """Run all rules x true count jobs not yet done, on a pool of workers (default: one per CPU).
+        A job interrupted (worker exited for restart, or killed) goes back on the queue, up to max_restarts times
+        in this run; its checkpoint lets it pick up where it stopped. If the pool breaks, a new one is started.
+        Return True if all jobs are done.
+    """
+    ledger = load_ledger(retry_failed=retry_failed)
     for rules in rules_to_run():
         for count in true_counts():
-            deal = Deal(rules=rules.instreams, true_count=count)
-            if deal.valuation_saved is None:
-                deal.save(save_valuation=True)
+            name = job_name(rules, count)
+            if name not in ledger:
+                ledger[name] = {
+                    'rules': rules.instreams,
+                    'true_count': count,
+                    'status': 'pending',
+                }
+    pending = [name for name, job in ledger.items() if job['status'] == 'pending']
+    log(f'{len(pending)} jobs pending of {len(ledger)}')
+    # A fresh process for each job, so no job inherits another's cache of states.
+    # Jobs are submitted only as workers come free, so a job marked running has in fact started.
+    workers = workers or os.cpu_count()
+    restarts = {}       # Times each job was interrupted, this run
+    while pending:
+        with ProcessPoolExecutor(max_workers=workers, max_tasks_per_child=1) as pool:
+            futures = {}
+            broken = False
+            while futures or (pending and not broken):
+                while pending and not broken and len(futures) < workers:
+                    job = ledger[pending[0]]
+                    try:
+                        future = pool.submit(run_job, tuple(job['rules']), job['true_count'])
+                    except BrokenProcessPool:
+                        broken = True
+                        break
+                    futures[future] = pending.pop(0)
+                    job['status'] = 'running'
+                    job['started'] = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+                    save_ledger(ledger)
+                if not futures:
+                    break
+                done, _ = wait(futures, return_when=FIRST_COMPLETED)
+                for future in done:
+                    name = futures.pop(future)
+                    job = ledger[name]
+                    job['finished'] = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+                    try:
+                        job.update(future.result())
+                        job['status'] = 'done'
+                        job.pop('error', None)
+                        log(f"{name}: done in {job['elapsed']:.0f} sec, {job['nodes']} nodes")
+                    except (SystemExit, BrokenProcessPool) as e:
+                        # Worker exited for restart (see Deal.manage_cache) or was killed; resume from checkpoint
+                        broken = broken or isinstance(e, BrokenProcessPool)
+                        restarts[name] = restarts.get(name, 0) + 1
+                        if restarts[name] <= max_restarts:
+                            job['status'] = 'pending'
+                            pending.append(name)
+                            log(f'{name}: interrupted; queued again ({restarts[name]} of {max_restarts} restarts)')
+                        else:
+                            job['status'] = 'failed'
+                            job['error'] = f'Interrupted {restarts[name]} times'
+                            log(f'{name}: FAILED: interrupted {restarts[name]} times')
+                    except Exception as e:
+                        job['status'] = 'failed'
+                        job['error'] = repr(e)
+                        log(f'{name}: FAILED: {e!r}')
+                    save_ledger(ledger)
+        if broken:
+            log(f'Worker pool broken; starting a new one for {len(pending)} jobs pending')
+    return all(job['status'] == 'done' for job in ledger.values())
 
 
 if __name__ == '__main__':
-    run_all_computations()
+    num_workers = None
+    if len(sys.argv) > 1:
+        num_workers = int(float(sys.argv[1]))
+    if not run_all_computations(workers=num_workers):
+        log('Jobs left pending or failed; exiting')
+        sys.exit(1)
     while True:
         log_occasional('All analysis complete! Turn off runner.', seconds=300)
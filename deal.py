@@ -1,20 +1,39 @@
-from functools import cache, cached_property
+from functools import cached_property, wraps
 import gc
-import json
-import os
+import psutil
 import sys
+import weakref
 
-from config import home_dir, log, log_occasional, show_deal_refs
+from config import card_indexes, card_values, home_dir, log, log_occasional, show_deal_refs
+from dealer import dealer_probs, dealer_totals
 from node import Node
-from hand import Hand
+from hand import Hand, hand_tables
 from rules import Rules
-from shoe import Shoe
+from shoe import Shoe, card_pdf, composition, down_card_pdf
+from splits import split_hand_valuation
+from state_key import encode, key_name
+from storage import DirectoryStore, WriteBehindStore
+
+
+# Module caches shared by all states, keyed by cards out; cleared when process memory is over budget
+shared_caches = [card_pdf, composition, down_card_pdf, dealer_probs, split_hand_valuation]
 
 
 class Deal(Node):
     node_save_threshold = 25000
     # cache_limit = 4000000
     cache_limit = 3000000
+    memory_limit = 8 * 1024 ** 3        # Bytes of process memory, checked every memory_check_interval new states
+    memory_check_interval = 10000
+    evict_fraction = 0.25
+    use_dealer_probs = True
+    decompose_splits = False            # If True, value post-split hands directly (see splits.py), not as child states
+    retain_finished = True              # If False, release finished states from cache as soon as they're valued
+    prune_reach = 0                     # If > 0, approximate states reached with lower probability (see estimated_valuation)
+    bound_actions = False               # If True, skip Player actions that can't be best (see action_upper_bounds)
+    keep_runner_up = True               # ...but not those that could be second best
+    store = WriteBehindStore(DirectoryStore())   # Where states are saved and loaded (see storage.py)
+    checkpoint = None                   # If set, snapshots of valuation runs, for resuming after restart (checkpoint.py)
 
     def __init__(
         self,
@@ -23,36 +42,157 @@ class Deal(Node):
         player=((0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0), False, '', 0, False, False),
         true_count=0,
     ):
+        self.key = self._cache_key[1]       # Packed by instance_key on the way in (see node.CachedInstance)
         self.rules = Rules(*rules)
-        self.shoe = Shoe(self, true_count=true_count)
-        self.dealer = Hand(self, 'Dealer', *dealer)
-        self.player = Hand(self, 'Player', *player)
+        self.tables = hand_tables(rules)
+        # Shoe and hands refer back weakly, so a state released from cache is freed at once, without a gc pass
+        me = weakref.proxy(self)
+        self.shoe = Shoe(me, true_count=true_count)
+        self.dealer = Hand(me, 'Dealer', *dealer)
+        self.player = Hand(me, 'Player', *player)
 
     def __repr__(self):
         return self.implied_name
 
     def clear(self, indent=0):
-        """Blow this object out of memory. Also do any child states recursively."""
-        if self.next_states is not None:
-            for child_data in self.next_states.values():
+        """Blow this object out of memory. Also do any child states recursively (those instantiated, not more)."""
+        next_states = self.__dict__.get('next_states')
+        if next_states is not None:
+            for child_data in next_states.values():
                 for card_data in child_data.values():
                     child = card_data['state']
                     child.clear(indent=indent + 2)
                     del child
-        self.shoe.deal = None
-        self.player.deal = None
-        self.dealer.deal = None
         super().clear()
         Node.pop_reference(self)
 
+    @cached_property
+    def dealer_valuation(self):
+        """If Player is done and Dealer is about to turn the down card, value this state directly
+            from the distribution of Dealer final totals, instead of expanding Dealer play as child states.
+        """
+        if not self.use_dealer_probs or not self.next_is_down_card_turn:
+            return None
+        probs = dealer_probs(
+            self.rules.hit_soft_17,
+            self.shoe.decks,
+            self.shoe.true_count,
+            self.dealer.cards[0],
+            self.shoe.removed,
+        )
+        value = sum(p * self.player.value_against(t) for p, t in zip(probs, dealer_totals))
+        return [{
+            'action': 'Turn',
+            'value': value,
+            'nodes': 1,
+        }]
+
+    def action_upper_bounds(self):
+        """Cheap upper bounds on the value of the Player actions that are costly to value, by action.
+            Surrender, Stand and Double aren't included: each is valued exactly, and cheaply,
+            since its child states are leaves or go straight to the Dealer's final totals.
+            Hit: a card that busts the hand loses the bet; at best, any other card goes on to stand on 21,
+                valued against the Dealer's final totals for the cards out now (drawing a few more shifts those little).
+            Split: the post-split hand valued directly (see splits.py), which is its exact value.
+        """
+        hand = self.player
+        bounds = {}
+        if 'Hit' in self.next_actions:
+            probs = dealer_probs(
+                self.rules.hit_soft_17,
+                self.shoe.decks,
+                self.shoe.true_count,
+                self.dealer.cards[0],
+                self.shoe.removed,
+            )
+            pays = self.tables.payoffs[False, hand.split_count]
+            best = sum(p * pays[21][min(t, 22)] for p, t in zip(probs, dealer_totals))
+            bust = 0.0
+            for card, prob in self.next_card_pdf.items():
+                if hand.hard_total + card_values[card_indexes[card]] > 21:
+                    bust += prob
+            bounds['Hit'] = (1 - bust) * best + bust * pays[22][17]
+        if 'Split' in self.next_actions:
+            bounds['Split'] = split_hand_valuation(
+                self.rules.instreams,
+                self.shoe.true_count,
+                self.dealer.cards[0],
+                self.shoe.removed,
+                hand.cards[0],
+                hand.split_count + 1,
+            )[0]
+        return bounds
+
+    def eviction_weight(self, hits):
+        """Only finished states may be evicted; keep those that were costly to compute and that get reused."""
+        if 'valuation' not in self.__dict__:
+            return None
+        return max(v['nodes'] for v in self.valuation) * (1 + hits)
+
     @property
+    def child_names(self):
+        """Child states by action and card, as in next_states, but by name, for saving. Each child is made in turn
+            and released again unless kept in cache as a finished state, so saving leaves no children behind.
+        """
+        if self.next_actions is None:
+            return None
+        result = {action: {} for action in self.next_actions}
+        for action, card, prob, child in self.iter_next_states():
+            result[action][card] = {
+                'state': str(child),
+                'prob': prob,
+            }
+            if not self.retain_finished or 'valuation' not in child.__dict__:
+                child.release()
+        return result
+
+    @property
+    def count_dir(self):
+        return f'{home_dir}/states/{self.rules}/TC{self.shoe.true_count:+.1f}'
+
+    def estimated_valuation(self):
+        """Cheap stand-in for the valuation of a state pruned in approximate mode (prune_reach > 0),
+            with a bound on its error:
+            If Player can stand, the value of standing now; the state's true value is at least that,
+                and at most the most the hand could still win.
+            Otherwise, 0, with error bound the most the hand could still win or lose.
+            The bound is carried up as 'error' in valuations, weighted as values are; such valuations aren't saved.
+        """
+        hand = self.player
+        hands = hand.split_count + 1
+        if hand.is_pair or hand.num_cards < 2:
+            hands = max(hands, self.rules.splits_allowed + 1)           # May yet be split (further)
+        per_hand = 2.0 if hand.num_cards <= 2 or hand.doubled else 1.0  # May yet double (or Blackjack)
+        bound = hands * per_hand
+        if self.next_actions is not None and 'Stand' in self.next_actions:
+            value = self.new_deal(stand=True).valuation[0]['value']
+            error = bound - value
+        else:
+            value = 0.0
+            error = bound
+        return [{
+            'action': 'Estimate',
+            'value': value,
+            'nodes': 1,
+            'error': error,
+        }]
+
+    @cached_property
     def fpath(self):
-        rule_dir = str(self.rules)
-        count_dir = f'TC{self.shoe.true_count:+.1f}'
         cards_dir = self.dealer.cards[:2]
         if self.dealer.num_cards > 0:
-            return f'{home_dir}/states/{rule_dir}/{count_dir}/{cards_dir}/{self.implied_name}.json'
-        return f'{home_dir}/states/{rule_dir}/{count_dir}/{self.implied_name}.json'
+            return f'{self.count_dir}/{cards_dir}/{key_name(self.key)}.json'
+        return f'{self.count_dir}/{key_name(self.key)}.json'
+
+    @staticmethod
+    def instance_key(
+        rules=(1.5, 6, False, 'Any2', 3, True, True, True),
+        dealer=((0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0), False, '', 0, False, False),
+        player=((0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0), False, '', 0, False, False),
+        true_count=0,
+    ):
+        """Unique by packed state key, rather than by the nested tuple of args (see state_key.py)."""
+        return encode(rules, dealer, player, true_count)
 
     @staticmethod
     def from_cards(
@@ -77,18 +217,46 @@ class Deal(Node):
         return self.next_hand is None
 
     def load(self):
-        if not os.path.isfile(self.fpath):
+        contents = self.store.load(self)
+        if contents is None:
             return None
-        with open(self.fpath, 'r') as fp:
-            contents = json.load(fp)
         return contents['deal']
 
+    @classmethod
+    def manage_cache(cls, cache_size):
+        """Keep cache within cache_limit states and memory_limit bytes, evicting finished states as needed.
+            Evicted states are freed as soon as nothing else refers to them (no gc pass needed; see __init__).
+            Memory isn't necessarily returned to the OS after eviction, so exceeding memory_limit
+            lowers cache_limit to the current cache size; from then on, the count limit is what binds,
+            unless process memory grows further still.
+        """
+        if cache_size <= cls.cache_limit:
+            cls.memory_checks = getattr(cls, 'memory_checks', 0) + 1
+            if cls.memory_checks % cls.memory_check_interval:
+                return
+            rss = psutil.Process().memory_info().rss
+            if rss <= max(cls.memory_limit, getattr(cls, 'memory_limited_rss', 0)):
+                return
+            shared = sum(f.cache_info().currsize for f in shared_caches)
+            for f in shared_caches:
+                f.cache_clear()
+            log(f'Process memory {rss} > limit of {cls.memory_limit}; cleared {shared} shared cache entries, '
+                f'cache limit now {cache_size}')
+            cls.memory_limited_rss = rss
+            cls.cache_limit = cache_size
+        target = int(cache_size * cls.evict_fraction)
+        evicted = Node.evict(target)
+        if evicted == 0:
+            log(f'Cache size {cache_size} > limit of {cls.cache_limit}, nothing to evict; exiting for restart...')
+            if cls.checkpoint is not None:
+                cls.checkpoint.save()
+            sys.exit(0)
+        log(f'Cache size {cache_size} > limit of {cls.cache_limit}; evicted {evicted} finished states')
+
     def new_deal(self, card='', surrendered=None, split=False, doubled=None, stand=None):
-        """Check cache size first; if too large, exit to avoid memory overflow"""
+        """Check cache size first; if too large, evict finished states to avoid memory overflow"""
         cache_size = len(self.__class__._instances)
-        if cache_size > self.cache_limit:
-            log(f'Cache size {cache_size} > limit of {self.cache_limit}; exiting for restart...')
-            sys.exit(0)
+        self.manage_cache(cache_size)
         """Instantiate child state from this one, with modifications as specified in args."""
         current_hand = self.next_hand
         sur = current_hand.surrendered if surrendered is None else surrendered
@@ -161,51 +329,11 @@ class Deal(Node):
             return 'Dealer'
         return None
 
-    @cached_property
-    def next_states(self):
-        if self.next_actions is None:
-            return None
-        result = {}
-        for action in self.next_actions:
-            if action == 'Deal':
-                result['Deal'] = self.next_states_adding_card()
-            elif action == 'Turn':
-                if not self.player.is_done:
-                    raise ValueError(f'Bad state ordering: {self.implied_name}')
-                result['Turn'] = self.next_states_adding_card()
-            elif action == 'Surrender':
-                result['Surrender'] = {
-                    '<no card>': {
-                        'state': self.new_deal(surrendered=True),
-                        'prob': 1.0,
-                    }
-                }
-            elif action == 'Split':
-                result['Split'] = {
-                    '<no card>': {
-                        'state': self.new_deal(split=True),
-                        'prob': 1.0,
-                    }
-                }
-            elif action == 'Double':
-                result['Double'] = self.next_states_adding_card(doubled=True)
-            elif action == 'Hit':
-                result['Hit'] = self.next_states_adding_card()
-            elif action == 'Stand':
-                result['Stand'] = {
-                    '<no card>': {
-                        'state': self.new_deal(stand=True),
-                        'prob': 1.0,
-                    }
-                }
-            else:
-                raise ValueError(f'Bad action "{action}"')
-        return result
-
-    def next_states_adding_card(self, doubled=None):
+    @property
+    def next_card_pdf(self):
         # A Deal action gets a new card, so we enumerate states by new card.
-        card_states = {}
-        pdf = self.shoe.pdf
+        # Probabilities come from the shoe's shared cache (see shoe.py), so aren't to be modified.
+        shoe = self.shoe
         if self.next_is_down_card_deal:
             """If up card is a T, then down card is either
                     A (Blackjack, hand over) or 
@@ -217,50 +345,56 @@ class Deal(Node):
                     If up card is a T, down card is something from 2 to T (no A)
                     If up card is an A, down card is something from 2 to 9 or A (no T)
             """
-            if self.dealer.cards == 'T':
-                pdf = {
-                    'A': pdf['A'],
-                    'x': 1 - pdf['A'],
-                }
-            elif self.dealer.cards == 'A':
-                pdf = {
-                    'T': pdf['T'],
-                    'x': 1 - pdf['T'],
-                }
-            else:
-                pdf = {
-                    'x': 1.0,
-                }
-        elif self.next_is_down_card_turn:
-            if self.dealer.cards[0] == 'T':
-                # If up card is a T and we're still playing, down card can't be an A.
-                adj_factor = pdf['A']
-                pdf = {c: p / (1 - adj_factor) for c, p in pdf.items()}
-                del pdf['A']
-            elif self.dealer.cards[0] == 'A':
-                # If up card is an A and we're still playing, down card can't be a T.
-                adj_factor = pdf['T']
-                pdf = {c: p / (1 - adj_factor) for c, p in pdf.items()}
-                del pdf['T']
+            return down_card_pdf(shoe.decks, shoe.true_count, shoe.removed, self.dealer.cards)
+        if self.next_is_down_card_turn:
+            # If up card is a T (A) and we're still playing, down card can't be an A (T).
+            excluded = {'T': 'A', 'A': 'T'}.get(self.dealer.cards[0], '')
+            return card_pdf(shoe.decks, shoe.true_count, shoe.removed, excluded)
+        return shoe.pdf
+
+    def iter_next_states(self, actions=None):
+        """Yield (action, card, prob, state) for each child state, instantiating each child only when reached.
+            Children of all next actions, or only of those in actions, in that order.
+        """
+        for action in self.next_actions if actions is None else actions:
+            if action in ['Deal', 'Turn', 'Double', 'Hit']:
+                if action == 'Turn' and not self.player.is_done:
+                    raise ValueError(f'Bad state ordering: {self.implied_name}')
+                doubled = True if action == 'Double' else None
+                for card, prob in self.next_card_pdf.items():
+                    if prob <= 0:
+                        continue
+                    yield action, card, prob, self.new_deal(card, doubled=doubled)
+            elif action == 'Surrender':
+                yield action, '<no card>', 1.0, self.new_deal(surrendered=True)
+            elif action == 'Split':
+                yield action, '<no card>', 1.0, self.new_deal(split=True)
+            elif action == 'Stand':
+                yield action, '<no card>', 1.0, self.new_deal(stand=True)
             else:
-                pass    # Shoe pdf is correct; no reweighting required
-        for card, prob in pdf.items():
-            if prob <= 0:
-                continue
-            sub_deal = self.new_deal(card, doubled=doubled)
-            card_states[card] = {
-                'state': sub_deal,
+                raise ValueError(f'Bad action "{action}"')
+
+    @cached_property
+    def next_states(self):
+        if self.next_actions is None:
+            return None
+        result = {action: {} for action in self.next_actions}
+        for action, card, prob, state in self.iter_next_states():
+            result[action][card] = {
+                'state': state,
                 'prob': prob,
             }
-        return card_states
+        return result
 
     def save(self, save_valuation=False):
-        data = self.state_for_json
+        if self.store.slim:
+            data = {'summary': {'state': self.implied_name}}
+        else:
+            data = self.state_for_json
         if save_valuation:
             data['valuation'] = self.valuation
-        os.makedirs(os.path.dirname(self.fpath), exist_ok=True)
-        with open(self.fpath, 'w') as fp:
-            json.dump(data, fp, indent=4)
+        self.store.save(self, data)
+        self.invalidate('state')
 
     def show_refs(self):
         """WARNING: VERY SLOW"""
@@ -280,7 +414,7 @@ class Deal(Node):
                 'state': self.implied_name,
                 'to_play': self.next_player,
             },
-            'children': self.next_states,
+            'children': self.child_names,
             'player': self.player.state,
             'dealer': self.dealer.state,
             'rules': self.rules.implied_name,
@@ -319,81 +453,216 @@ class Deal(Node):
         v['nodes'] = 1
         return v
 
+    @cached_property
+    def split_valuation(self):
+        """If Player has just split, and holds the split card alone, value this state directly
+            by decomposing the post-split hand (see splits.py), instead of expanding it as child states.
+        """
+        hand = self.player
+        if not self.decompose_splits or hand.split_count == 0 or hand.num_cards != 1 or self.dealer.num_cards < 2:
+            return None
+        value, nodes = split_hand_valuation(
+            self.rules.instreams,
+            self.shoe.true_count,
+            self.dealer.cards[0],
+            self.shoe.removed,
+            hand.split_card,
+            hand.split_count,
+        )
+        return [{
+            'action': 'Deal',
+            'value': value,
+            'nodes': nodes,
+        }]
+
     @cached_property
     def valuation(self):
-        """Compute value to Player, and number of child nodes, recursively.
+        """Compute value to Player, and number of child nodes, for this state and all states below it.
             If I have a leaf value, return that value (1 node).
             If no leaf value, I must have child states:
                 At action levels, choose highest-value action, noting its value and node count
                 At card pdf levels, compute a weighted average value based on probabilities of each card
                     and value of resulting state
+            Child states are worked through with an explicit stack rather than by recursion (see ValuationFrame).
+            In approximate mode, results also carry 'error', a bound on how far 'value' may be from exact.
         """
         if self.valuation_leaf is not None:
             # log(f'{self.implied_name} valuation OK')
             return [self.valuation_leaf]
+        if self.dealer_valuation is not None:
+            return self.dealer_valuation
+        if self.split_valuation is not None:
+            return self.split_valuation
+        stack = [ValuationFrame(self)]
+        if self.checkpoint is not None:
+            self.checkpoint.stack = stack       # Followed as it changes, for the depth of states recorded
+        while True:
+            frame = stack[-1]
+            child = frame.advance()
+            if child is not None:
+                stack.append(ValuationFrame(child, frame.child_reach))
+                continue
+            stack.pop()
+            results = frame.results()
+            if not stack:
+                return results
+            frame.deal.__dict__['valuation'] = results
+            if self.checkpoint is not None:
+                self.checkpoint.record(frame.deal, results)
+            stack[-1].fold(results)
+
+    def release(self):
+        """Remove this state from cache, so it can be freed once nothing else refers to it."""
+        Node.pop_reference(self)
+
+    def save_if_wanted(self, val):
+        """If valuation is for a starting hand or has many many nodes, save for later use"""
+        if any(v.get('error') for v in val):
+            return      # Approximate; not for reuse as exact
+        max_nodes = 0
+        for v in val:
+            max_nodes = max(max_nodes, v['nodes'])
+        if max_nodes >= self.node_save_threshold:
+            if not self.valuation_is_saved:
+                log(f'Saving {self.implied_name} ({max_nodes} max nodes)...')
+                self.save(save_valuation=True)
+        # We care particularly about starting hands
+        elif self.player.num_cards <= 2 and self.dealer.num_cards <= 2 and not (
+            self.player.surrendered or
+            self.player.split_count > 0 or
+            self.player.doubled or
+            self.player.stand
+        ):
+            if not self.valuation_is_saved:
+                log(f'Saving starting hand {self.implied_name} ({max_nodes} max nodes)...')
+                self.save(save_valuation=True)
+
+    @property
+    def valuation_is_saved(self):
+        return self.store.exists(self)
+
+    @property
+    def valuation_saved(self):
+        # If I previously saved valuation, load and use that
+        saved_data = self.store.load(self)
+        if saved_data is not None and 'valuation' in saved_data:
+            return saved_data['valuation']
+        return None
+
+
+class ValuationFrame:
+    """One state being valued by Deal.valuation: its child states are instantiated one at a time,
+        and each child's value is folded into the running total for its action as soon as it's known.
+        The child is then released, so only the states on the path being worked hold children in memory.
+        reach is the probability of getting to this state from the state being valued, for approximate mode.
+
+        With Deal.bound_actions, Player actions are valued cheapest first, then the rest in order of upper bound,
+        best first. An action whose upper bound is below the best value so far (or second best, to keep
+        the runner-up exact) is skipped; its bound is reported in place of its value, flagged 'bound'.
+    """
+    __slots__ = ('deal', 'reach', 'children', 'totals', 'pending', 'bounds', 'done')
+
+    def __init__(self, deal, reach=1.0):
+        self.deal = deal
+        self.reach = reach
+        self.totals = {action: [0.0, 0, 0.0] for action in deal.next_actions}
+        self.pending = None
+        self.bounds = {}
+        self.done = []          # Actions fully valued
+        if deal.bound_actions and deal.next_player == 'Player':
+            self.bounds = deal.action_upper_bounds()
+        if self.bounds:
+            self.children = self.iter_bounded()
+        else:
+            self.children = deal.iter_next_states()
+
+    def advance(self):
+        """Fold in child states whose valuation is already known, in memory or on disk.
+            Return the next child state that must be valued first, or None if all children are done.
+        """
+        for action, card, prob, child in self.children:
+            self.pending = action, prob, child
+            if 'valuation' in child.__dict__:                   # Already computed & cached in memory
+                # log(f'Using cached valuation for {child.implied_name}...')
+                self.fold(child.valuation)
+            elif child.valuation_leaf is not None or child.dealer_valuation is not None or (
+                    child.split_valuation is not None):
+                self.fold(child.valuation)                      # Known without child states of its own
+            elif self.deal.checkpoint is not None and child.key in self.deal.checkpoint.valuations:
+                child.__dict__['valuation'] = self.deal.checkpoint.get(child.key)  # Valued before a restart
+                self.fold(child.valuation)
+            elif child.valuation_is_saved:                      # Already computed & saved to disk
+                log(f'Using saved valuation for {child.implied_name}...')
+                self.fold(child.valuation_saved, saved=True)
+            elif self.child_reach < self.deal.prune_reach:      # Approximate mode, and too unlikely to compute
+                self.fold(child.estimated_valuation(), saved=True)
+            else:
+                return child                                    # Not yet computed; compute
+        return None
+
+    @property
+    def child_reach(self):
+        return self.reach * self.pending[1]
+
+    def iter_bounded(self):
+        """As Deal.iter_next_states, but skipping actions that can't be best (or runner-up)."""
+        exact = [a for a in self.deal.next_actions if a not in self.bounds]
+        bounded = sorted(self.bounds, key=lambda a: self.bounds[a], reverse=True)
+        for action in exact + bounded:
+            if action in self.bounds:
+                # Lowest value an action must beat to be best (or runner-up); valuation errors count against
+                values = sorted((self.totals[a][0] - self.totals[a][2] for a in self.done), reverse=True)
+                need = 2 if self.deal.keep_runner_up else 1
+                if len(values) >= need and self.bounds[action] < values[need - 1]:
+                    self.totals[action][0] = self.bounds[action]
+                    continue
+            yield from self.deal.iter_next_states([action])
+            self.done.append(action)
+
+    def fold(self, child_val, saved=False):
+        action, prob, child = self.pending
+        if not saved:
+            child.save_if_wanted(child_val)
+        self.totals[action][0] += prob * child_val[0]['value']
+        self.totals[action][1] += child_val[0]['nodes']
+        # Child's value is the best of its actions; it's off by no more than the largest of their errors
+        self.totals[action][2] += prob * max(v.get('error', 0.0) for v in child_val)
+        if not self.deal.retain_finished:
+            child.release()
+        else:
+            Node.add_candidate(child)               # Finished; may be evicted from cache if need be
+        self.pending = None
+
+    def results(self):
         results = []
-        for action, state_data in self.next_states.items():
-            val_tot = 0
-            node_tot = 0
-            for card, card_data in state_data.items():
-                child_state = card_data['state']
-                """If child has valuation already saved to disk, retrieve and use that instead."""
-                if 'valuation' in child_state.__dict__:             # Already computed & cached in memory
-                    # log(f'Using cached valuation for {child_state.implied_name}...')
-                    child_val = child_state.valuation
-                elif child_state.valuation_is_saved:                # Already computed & saved to disk
-                    child_val = child_state.valuation_saved
-                    log(f'Using saved valuation for {child_state.implied_name}...')
-                else:
-                    child_val = child_state.valuation               # Not yet computed; compute
-
-                """If valuation is for a starting hand or has many many nodes, save for later use"""
-                if not child_state.valuation_is_saved:
-                    max_nodes = 0
-                    for child in child_val:
-                        max_nodes = max(max_nodes, child['nodes'])
-                    if max_nodes >= self.node_save_threshold:
-                        log(f'Saving {child_state.implied_name} ({max_nodes} max nodes)...')
-                        child_state.save(save_valuation=True)
-                    # We care particularly about starting hands
-                    elif child_state.player.num_cards <= 2 and child_state.dealer.num_cards <= 2 and not (
-                        child_state.player.surrendered or
-                        child_state.player.split_count > 0 or
-                        child_state.player.doubled or
-                        child_state.player.stand
-                    ):
-                        log(f'Saving starting hand {child_state.implied_name} ({max_nodes} max nodes)...')
-                        child_state.save(save_valuation=True)
-
-                val_tot += card_data['prob'] * child_val[0]['value']
-                node_tot += child_val[0]['nodes']
+        for action, (val_tot, node_tot, err_tot) in self.totals.items():
             result = {
                 'action': action,
                 'value': val_tot,
                 'nodes': node_tot,
             }
+            if err_tot:
+                result['error'] = err_tot
+            if action in self.bounds and action not in self.done:
+                result['bound'] = 'upper'
             results.append(result)
         results = sorted(results, key=lambda r: r['value'], reverse=True)
-        self.invalidate('next_states')
+        self.deal.invalidate('next_states')
+        self.children = None        # iter_bounded refers back to this frame; break the cycle
         return results
 
-    @property
-    def valuation_is_saved(self):
-        return os.path.isfile(self.fpath)
 
-    @property
-    def valuation_saved(self):
-        # If I previously saved valuation, load and use that
-        if os.path.isfile(self.fpath):
-            try:
-                with open(self.fpath, 'r') as fp:
-                    saved_data = json.load(fp)
-            except json.decoder.JSONDecodeError as e:
-                log(f'ERROR: {self.fpath} failed to load')
-                raise e
-            if 'valuation' in saved_data:
-                return saved_data['valuation']
-        return None
+def pool_job(func):
+    """Decorate a function run as a job in a pool worker, so that Deal.store is flushed when it ends, however it ends:
+        pool workers exit without running atexit handlers, so saves still held would be lost.
+    """
+    @wraps(func)
+    def job(*args, **kwargs):
+        try:
+            return func(*args, **kwargs)
+        finally:
+            Deal.store.flush()
+    return job
 
 
 if __name__ == '__main__':
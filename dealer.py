@@ -0,0 +1,62 @@
+"""Dealer final-total distributions, computed directly rather than by expanding Dealer play as Deal states.
+
+Once the Player is done, the Dealer's play depends only on the up card, the hit/stand soft 17 rule,
+and which cards are out of the shoe. So for any Player hand that stands (or doubles, or finishes a split hand),
+the value of the state is a dot product: Player return against each Dealer final total,
+weighted by the probability of that total. Distributions are cached, up to a bound (see shoe.py).
+"""
+from functools import lru_cache
+
+from config import card_indexes, card_values
+from shoe import composition
+
+
+dealer_totals = (17, 18, 19, 20, 21, 22)        # 22 stands for any Dealer bust
+
+
+@lru_cache(maxsize=1 << 18)
+def dealer_probs(hit_soft_17, decks, true_count, upcard, removed):
+    """Return probabilities of Dealer final totals (ordered as dealer_totals), from the down card turn onward.
+        upcard is the Dealer's up card symbol.
+        removed is the 11-slot count of cards out of the shoe, Dealer up card included, as in Shoe.cards_out.
+    As in Deal.next_card_pdf: if the Dealer is still playing with a T or A up,
+    the down card can't make Blackjack, so it can't be an A or T respectively.
+    """
+    counts = list(composition(decks, true_count, removed))
+    counts[card_indexes['x']] = 0
+    up = card_indexes[upcard]
+    excluded = {'T': card_indexes['A'], 'A': card_indexes['T']}.get(upcard)
+    memo = {}
+
+    def play(hard, aces, first):
+        total = hard + 10 if aces and hard <= 11 else hard
+        if total > 21:
+            return [0.0, 0.0, 0.0, 0.0, 0.0, 1.0]
+        soft = total != hard
+        if not first and total >= 17 and not (hit_soft_17 and total == 17 and soft):
+            result = [0.0, 0.0, 0.0, 0.0, 0.0, 0.0]
+            result[total - 17] = 1.0
+            return result
+        key = tuple(counts)
+        if not first and key in memo:
+            return memo[key]
+        num_cards = sum(counts)
+        if first and excluded is not None:
+            num_cards -= counts[excluded]
+        result = [0.0, 0.0, 0.0, 0.0, 0.0, 0.0]
+        for i in range(10):
+            if first and i == excluded:
+                continue
+            prob = counts[i] / num_cards if num_cards != 0 else 0
+            if prob <= 0:
+                continue
+            counts[i] -= 1
+            sub = play(hard + card_values[i], aces or i == card_indexes['A'], False)
+            counts[i] += 1
+            for j in range(len(result)):
+                result[j] += prob * sub[j]
+        if not first:
+            memo[key] = result
+        return result
+
+    return tuple(play(card_values[up], up == card_indexes['A'], True))
@@ -0,0 +1,99 @@
+"""Dealer final-total distributions for many shoe compositions at once, using NumPy array operations.
+
+Each row of a compositions array is an 11-slot count of cards remaining in the shoe, laid out as Shoe.counts,
+with the Dealer up card (and any other cards dealt) already removed.
+Rather than one recursion per row, we carry every row's probability together:
+Dealer hands are tracked by the multiset of cards drawn after the up card, and the probability of reaching
+each multiset is a vector over rows. Drawing rank i from multiset m has probability
+    (remaining[i] - m[i]) / (remaining total - cards in m)
+regardless of the order in which m was drawn, so hands reaching the same multiset are merged level by level.
+"""
+import numpy as np
+
+from config import card_indexes, card_values
+from dealer import dealer_totals
+from shoe import base_counts
+
+
+def compositions_for(decks, true_counts, removed=(0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0)):
+    """Return an array of shoe compositions, one row per true count, with the removed cards taken out."""
+    rows = [base_counts(decks, tc) for tc in true_counts]
+    comps = np.array(rows, dtype=float) - np.array(removed, dtype=float)
+    comps[:, card_indexes['x']] = 0
+    return comps
+
+
+def dealer_distributions(compositions, upcard, hit_soft_17=False):
+    """Return an (n, 6) array of probabilities of Dealer final totals (ordered as dealer.dealer_totals),
+        for each of the n rows of compositions, from the down card turn onward.
+    As in dealer.dealer_probs, a Dealer still playing with a T or A up can't have Blackjack,
+    so the down card can't be an A or T respectively.
+    """
+    comps = np.atleast_2d(np.asarray(compositions, dtype=float))[:, :10]
+    remaining = comps.sum(axis=1)
+    result = np.zeros((len(comps), len(dealer_totals)))
+    up = card_indexes[upcard]
+    excluded = {'T': card_indexes['A'], 'A': card_indexes['T']}.get(upcard)
+    ace = card_indexes['A']
+
+    # Down card turn: the first draw, with the Blackjack card excluded
+    level = {}
+    denom = remaining - comps[:, excluded] if excluded is not None else remaining
+    for i in range(10):
+        if i == excluded:
+            continue
+        prob = _draw_probs(comps[:, i], denom)
+        if not prob.any():
+            continue
+        drawn = [0] * 10
+        drawn[i] = 1
+        level[tuple(drawn)] = prob, card_values[up] + card_values[i]
+
+    # Dealer hits: resolve finished hands into result, advance the rest by one card.
+    # All ten ranks' draw probabilities for a hand come from one array operation, (n, 10)
+    num_drawn = 1
+    while level:
+        next_level = {}
+        with np.errstate(divide='ignore', invalid='ignore'):
+            scale = np.where(remaining != num_drawn, 1 / (remaining - num_drawn), 0.0)[:, None]
+        for drawn, (reach, hard) in level.items():
+            aces = up == ace or drawn[ace] > 0
+            total = hard + 10 if aces and hard <= 11 else hard
+            if total > 21:
+                result[:, -1] += reach
+                continue
+            soft = total != hard
+            if total >= 17 and not (hit_soft_17 and total == 17 and soft):
+                result[:, total - 17] += reach
+                continue
+            probs = np.maximum(comps - drawn, 0) * scale
+            for i in np.flatnonzero(probs.any(axis=0)):
+                key = drawn[:i] + (drawn[i] + 1,) + drawn[i + 1:]
+                if key in next_level:
+                    next_level[key][0] += reach * probs[:, i]
+                else:
+                    next_level[key] = [reach * probs[:, i], hard + card_values[i]]
+        level = next_level
+        num_drawn += 1
+    return result
+
+
+def _draw_probs(counts, num_cards):
+    """Per-row probability of drawing a card of a rank with these counts; none where no such card remains."""
+    with np.errstate(divide='ignore', invalid='ignore'):
+        probs = np.where(num_cards != 0, counts / num_cards, 0.0)
+    return np.where(probs > 0, probs, 0.0)
+
+
+if __name__ == '__main__':
+    from datetime import datetime
+    from compute import true_counts
+    from config import card_symbols, log
+
+    start = datetime.now()
+    for card in card_symbols[:10]:
+        removed = [0] * 11
+        removed[card_indexes[card]] = 1
+        dists = dealer_distributions(compositions_for(6, true_counts(), removed), card)
+    elapsed = (datetime.now() - start).total_seconds()
+    log(f'{len(true_counts()) * 10} compositions x up cards in {elapsed:.2f} sec')
@@ -1,7 +1,33 @@
+from functools import cache
+
 from config import card_symbols, card_values, card_indexes
+from rules import Rules
+
+
+_unset = object()
 
 
 class Hand:
+    """Totals, softness, pair status and card count are fixed for a hand, so they're computed once
+        at construction-- from the counts, or incrementally by new_hand from its parent hand plus the added card.
+    """
+    __slots__ = (
+        'deal',
+        'player',
+        'counts',
+        'surrendered',
+        'split_card',
+        'split_count',
+        'doubled',
+        'stand',
+        'num_cards',
+        'hard_total',
+        'total',
+        'is_soft',
+        'is_pair',
+        '_actions',
+    )
+
     def __init__(
         self,
         deal,
@@ -11,7 +37,10 @@ class Hand:
         split_card='',
         split_count=0,
         doubled=False,
-        stand=False
+        stand=False,
+        num_cards=None,
+        hard_total=None,
+        is_pair=None,
     ):
         self.deal = deal
         self.player = player
@@ -21,6 +50,20 @@ class Hand:
         self.split_count = split_count
         self.doubled = doubled
         self.stand = stand
+        if num_cards is None:
+            num_cards = sum(counts)
+            hard_total = sum([counts[i] * card_values[i] for i in card_indexes.values()])
+            is_pair = num_cards == 2 and max(counts) == 2
+        self.num_cards = num_cards
+        self.hard_total = hard_total
+        # Best point total for the hand
+        if hard_total <= 11 and counts[card_indexes['A']] > 0:
+            self.total = hard_total + 10
+        else:
+            self.total = hard_total
+        self.is_soft = self.total != hard_total
+        self.is_pair = is_pair
+        self._actions = _unset
 
     def __lt__(self, other):
         return self.implied_name < other.implied_name
@@ -30,25 +73,45 @@ class Hand:
 
     @property
     def actions(self):
+        if self._actions is _unset:
+            self._actions = self.legal_actions()
+        return self._actions
+
+    def legal_actions(self):
+        """Looked up from the Deal's HandTables; the same decisions as the can_ properties below, made in advance.
+            Lists returned are shared; don't modify them.
+        """
         if self.surrendered or self.doubled or self.stand or self.total >= 21:
             return None
-        if self.can_deal:
-            return ['Deal']
-        if self.can_turn:
-            return ['Turn']
-        acts = []
-        if self.can_surrender:
-            acts.append('Surrender')
-        if self.can_split:
-            acts.append('Split')
-        if self.can_double:
-            acts.append('Double')
-        if self.can_hit:
-            acts.append('Hit')
-        if self.can_stand:
-            acts.append('Stand')
-        if not acts:
-            return None
+        if self.num_cards < 2:
+            return deal_actions
+        if self.is_dealer:
+            if self.counts[card_indexes['x']] > 0:
+                return turn_actions
+            return self.deal.tables.dealer_actions[self.total, self.is_soft]
+        return self.deal.tables.player_actions[
+            self.total,
+            self.is_soft,
+            self.num_cards == 2,
+            self.is_pair,
+            self.split_count,
+            self.split_card == 'A',
+        ]
+
+    def actions_under(self, rules):
+        """Actions as above, but with the rule-dependent checks made against rules other than this Deal's.
+            For valuing several rule sets over one tree walked under rules at least as permissive (see vector_valuation.py).
+            Surrender is also checked against late_surrender, which Deal states themselves don't apply.
+        """
+        acts = self.actions
+        if acts is None or self.is_dealer:
+            return acts
+        if 'Surrender' in acts and not rules.late_surrender:
+            acts = [a for a in acts if a != 'Surrender']
+        if 'Split' in acts and not self.rules_allow_split(rules):
+            acts = [a for a in acts if a != 'Split']
+        if 'Double' in acts and not self.rules_allow_double(rules):
+            acts = [a for a in acts if a != 'Double']
         return acts
 
     @property
@@ -63,8 +126,6 @@ class Hand:
             return False
         if self.num_cards != 2:
             return False
-        if self.split_count > 0 and not self.deal.rules.double_after_split:
-            return False
         if self.split_count > 0 and self.split_card == 'A':
             return False
         # For efficiency, never let anyone (i.e., Player) do anything as stupid as the below
@@ -72,7 +133,7 @@ class Hand:
             return False
         if self.total >= 20:
             return False
-        return True
+        return self.rules_allow_double(self.deal.rules)
 
     @property
     def can_hit(self):
@@ -101,11 +162,7 @@ class Hand:
             return False
         if not self.is_pair:
             return False
-        if self.split_count > 0 and self.split_card == 'A' and not self.deal.rules.resplit_aces:
-            return False
-        if self.split_count >= self.deal.rules.splits_allowed:
-            return False
-        return True
+        return self.rules_allow_split(self.deal.rules)
 
     @property
     def can_stand(self):
@@ -137,10 +194,6 @@ class Hand:
             cstr += card_symbols[i] * int(self.counts[i])
         return cstr
 
-    @property
-    def hard_total(self):
-        return sum([self.counts[i] * card_values[i] for i in card_indexes.values()])
-
     @property
     def implied_name(self):
         mods = ''
@@ -189,14 +242,6 @@ class Hand:
     def is_done(self):
         return self.actions is None
 
-    @property
-    def is_pair(self):
-        return self.num_cards == 2 and max(self.counts) == 2
-
-    @property
-    def is_soft(self):
-        return self.total != self.hard_total
-
     def new_hand(
         self,
         card='',
@@ -208,6 +253,9 @@ class Hand:
         counts = list(self.counts)
         split_card = self.split_card
         split_count = self.split_count
+        num_cards = self.num_cards
+        hard_total = self.hard_total
+        is_pair = self.is_pair
         if split:
             i = None
             for i, count in enumerate(counts):
@@ -216,10 +264,18 @@ class Hand:
             split_card = card_symbols[i]
             split_count = self.split_count + 1
             counts = [c / 2 for c in counts]
+            num_cards = 1
+            hard_total = card_values[i]
+            is_pair = False
         if card:
-            counts[card_indexes[card]] += 1
+            i = card_indexes[card]
+            counts[i] += 1
+            num_cards += 1
+            hard_total += card_values[i]
             if card != 'x':
+                num_cards -= counts[card_indexes['x']]
                 counts[card_indexes['x']] = 0
+            is_pair = num_cards == 2 and counts[i] == 2
         sur = self.surrendered if surrendered is None else surrendered
         dbl = self.doubled if doubled is None else doubled
         std = self.stand if stand is None else stand
@@ -231,14 +287,13 @@ class Hand:
             split_card=split_card,
             split_count=split_count,
             doubled=dbl,
-            stand=std
+            stand=std,
+            num_cards=num_cards,
+            hard_total=hard_total,
+            is_pair=is_pair,
         )
         return new_hand
 
-    @property
-    def num_cards(self):
-        return sum(self.counts)
-
     @property
     def outcome(self):
         if not self.is_decided:
@@ -252,15 +307,15 @@ class Hand:
             return 'Surrender'
         if dealer.is_blackjack:
             return 'Lose'
-        if self.is_busted:
-            return 'Bust'
-        if dealer.is_busted:
-            return 'Win'
-        if self.total > dealer.total:
-            return 'Win'
-        if self.total < dealer.total:
-            return 'Lose'
-        return 'Push'
+        return showdown_outcomes[min(int(self.total), 22)][min(int(dealer.total), 22)]
+
+    def rules_allow_double(self, rules):
+        return self.split_count == 0 or rules.double_after_split
+
+    def rules_allow_split(self, rules):
+        if self.split_count > 0 and self.split_card == 'A' and not rules.resplit_aces:
+            return False
+        return self.split_count < rules.splits_allowed
 
     @property
     def state(self):
@@ -281,12 +336,9 @@ class Hand:
             'value': self.value,
         }
 
-    @property
-    def total(self):
-        """Compute the best point total for the hand."""
-        if self.hard_total <= 11 and self.counts[card_indexes['A']] > 0:
-            return self.hard_total + 10
-        return self.hard_total
+    def value_against(self, dealer_total):
+        """Bet return to the Player standing on this hand, against a Dealer final total (over 21 is a bust)."""
+        return self.deal.tables.payoffs[self.doubled, self.split_count][min(int(self.total), 22)][min(dealer_total, 22)]
 
     @property
     def valuation_leaf(self):
@@ -303,23 +355,86 @@ class Hand:
     @property
     def value(self):
         """If this hand is terminal and outcome can be known, compute the bet return to the Player."""
-        if self.outcome is None:
+        outcome = self.outcome
+        if outcome is None:
             return None
-        if self.outcome == 'Blackjack':
-            return self.deal.rules.blackjack_pays
-        if self.outcome == 'Surrender':
+        if outcome == 'Blackjack':
+            return self.deal.tables.blackjack_pays
+        if outcome == 'Surrender':
             return -0.5
-        if self.outcome == 'Win':
-            val = 1.0
-        elif self.outcome in ['Bust', 'Lose']:
-            val = -1.0
-        else:
-            val = 0.0
-        if self.doubled:
-            val *= 2.0
-        if self.split_count:
-            val *= (self.split_count + 1.0)
-        return val
+        return self.deal.tables.outcome_payoffs[self.doubled, self.split_count][outcome]
+
+
+deal_actions = ['Deal']
+turn_actions = ['Turn']
+# Outcome of a showdown (neither hand a Blackjack, Player not surrendered), by Player total, Dealer total (22: bust)
+showdown_outcomes = [
+    [
+        'Bust' if p > 21 else 'Win' if d > 21 or p > d else 'Lose' if p < d else 'Push'
+        for d in range(23)
+    ] for p in range(23)
+]
+
+
+class HandTables:
+    """Hand decisions that depend only on the hand's situation and the rules, made once per set of rules:
+        player_actions      Player's legal actions, by (total, soft, two cards, pair, split count, split Aces),
+                            for a hand of at least 2 cards, below 21, not surrendered, doubled or stood
+        dealer_actions      Dealer's, by (total, soft), for a hand of at least 2 cards, down card seen, below 21
+        payoffs             Bet return, by (doubled, split count), by Player total, by Dealer final total (22: bust)
+        outcome_payoffs     Bet return, by (doubled, split count), by showdown outcome
+    The decisions are those of Hand's can_ properties.
+    """
+    def __init__(self, rules):
+        self.blackjack_pays = rules.blackjack_pays
+        splits = range(rules.splits_allowed + 1)
+        self.player_actions = {}
+        for total in range(2, 21):
+            for soft in (False, True):
+                if soft and total < 12:
+                    continue
+                hard_total = total - 10 if soft else total
+                for two_cards in (False, True):
+                    for pair in (False, True):
+                        for split_count in splits:
+                            for split_aces in (False, True):
+                                key = total, soft, two_cards, pair, split_count, split_aces
+                                self.player_actions[key] = player_actions(rules, hard_total, *key)
+        self.dealer_actions = {}
+        for total in range(2, 21):
+            for soft in (False, True):
+                hits = total <= 16 or (rules.hit_soft_17 and total == 17 and soft)
+                self.dealer_actions[total, soft] = ['Hit'] if hits else ['Stand']
+        self.payoffs = {}
+        self.outcome_payoffs = {}
+        for doubled in (False, True):
+            for split_count in splits:
+                bet = (2.0 if doubled else 1.0) * (split_count + 1.0)
+                results = {'Win': bet, 'Lose': -bet, 'Bust': -bet, 'Push': 0.0}
+                self.outcome_payoffs[doubled, split_count] = results
+                self.payoffs[doubled, split_count] = [[results[o] for o in row] for row in showdown_outcomes]
+
+
+def player_actions(rules, hard_total, total, soft, two_cards, pair, split_count, split_aces):
+    """Player's legal actions, for HandTables; None if none."""
+    acts = []
+    if split_count == 0 and total >= 12 and two_cards:
+        acts.append('Surrender')
+    if pair and not (split_count > 0 and split_aces and not rules.resplit_aces) and split_count < rules.splits_allowed:
+        acts.append('Split')
+    if two_cards and not (split_count > 0 and split_aces) and hard_total < 13 and total < 20 and (
+            split_count == 0 or rules.double_after_split):
+        acts.append('Double')
+    if not (split_count > 0 and split_aces) and hard_total < 18 and total < 20:
+        acts.append('Hit')
+    acts.append('Stand')
+    return acts
+
+
+@cache
+def hand_tables(rules):
+    """HandTables for rules (as Rules instreams), compiled on first use."""
+    return HandTables(Rules(*rules))
 
 
 if __name__ == '__main__':
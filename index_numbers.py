@@ -0,0 +1,147 @@
+"""Index numbers: the true count at which the best play of a starting hand changes.
+
+show_strategy finds deviations by comparing whole runs, one per 0.1 true count step. Here instead,
+for one starting hand against one Dealer up card, only that hand's subtree is valued (Deal.from_cards),
+at as few true counts as it takes to pin down where its best action changes, to 0.01
+(the finest true count a state key holds).
+
+Search runs from true count 0 out to limit, up or down. The gap, value of the best action at 0 less the best
+of the other actions, is positive at 0 and, where there's an index within limit, not positive at limit.
+The gap changes smoothly with true count, so each probe goes where the line through the bracket's ends
+crosses zero (false position) rather than at the midpoint; if the same end of the bracket moves twice running,
+the next probe is the midpoint, so the bracket narrows at least as fast as every other bisection step.
+Typically a hand with an index takes 4-7 subtree valuations; one without, 2.
+"""
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime
+import sys
+
+from config import log
+from deal import Deal, pool_job
+from rules import Rules
+from storage import StateStore
+
+
+upcards = ['2', '3', '4', '5', '6', '7', '8', '9', 'T', 'A']
+
+
+def action_values(cards, rules, true_count):
+    """Return dict of value by action for the state dealt as cards (saved, or computed now) at true_count."""
+    d = Deal.from_cards(cards, rules=rules.instreams, true_count=true_count)
+    val = d.valuation_saved or d.valuation
+    return {v['action']: v['value'] for v in val}
+
+
+def best_action(values):
+    return max(values, key=values.get)
+
+
+def gap(values, base):
+    others = [v for a, v in values.items() if a != base]
+    return values[base] - max(others) if others else float('inf')
+
+
+def index_number(cards, rules, direction=1, limit=10.0):
+    """Find the true count nearest 0, up (direction 1) or down (-1) to limit, to 0.01,
+        at which the best play of the state dealt as cards is no longer its best play at true count 0.
+        Return dict of:
+            'base': best action at true count 0
+            'action': best action at the index (None if no change within limit)
+            'index': the index (None if no change within limit)
+            'evaluations': number of true counts valued
+    """
+    probes = {}     # Action values by true count, in hundredths
+
+    def probe(h):
+        if h not in probes:
+            probes[h] = action_values(cards, rules, h / 100)
+        return probes[h]
+
+    base = best_action(probe(0))
+    lo, hi = 0, direction * round(limit * 100)    # Base action best at lo, not at hi
+    if best_action(probe(hi)) == base:
+        return {'base': base, 'action': None, 'index': None, 'evaluations': len(probes)}
+    gap_lo, gap_hi = gap(probe(lo), base), gap(probe(hi), base)
+    moved = 0       # Run of probes moving the same end: > 0 for lo, < 0 for hi
+    while abs(hi - lo) > 1:
+        if abs(moved) >= 2 or gap_lo - gap_hi <= 0 or gap_lo == float('inf'):
+            h = lo + (hi - lo) // 2 if hi > lo else lo - (lo - hi) // 2
+            moved = 0
+        else:
+            step = round(abs(hi - lo) * gap_lo / (gap_lo - gap_hi))
+            h = lo + direction * min(max(step, 1), abs(hi - lo) - 1)
+        values = probe(h)
+        if best_action(values) == base:
+            lo, gap_lo = h, gap(values, base)
+            moved = moved + 1 if moved > 0 else 1
+        else:
+            hi, gap_hi = h, gap(values, base)
+            moved = moved - 1 if moved < 0 else -1
+    return {'base': base, 'action': best_action(probe(hi)), 'index': hi / 100, 'evaluations': len(probes)}
+
+
+def starting_hands():
+    """Player's first two cards, by hand label as in checkout.strategy, for the hands a strategy chart covers."""
+    hands = {f'{c},{c}': c + c for c in 'AT98765432'}
+    hands.update({f'A,{c}': 'A' + c for c in '98765432'})
+    for total in range(17, 11, -1):
+        hands[str(total)] = 'T' + str(total - 10)
+    for total in range(11, 7, -1):
+        hands[str(total)] = str(total - 2) + '2'
+    return hands
+
+
+@pool_job
+def hand_indexes(rules, label, hand, upcard, limit):
+    """Pool job: index numbers, up and down, for one hand against one up card.
+        Probes aren't saved: most are at true counts no full run is made for, each its own set of states.
+    """
+    Deal.store = StateStore()
+    r = Rules(*rules)
+    cards = hand[0] + upcard + hand[1] + 'x'
+    up = index_number(cards, r, 1, limit)
+    down = index_number(cards, r, -1, limit)
+    return {
+        'hand': label,
+        'upcard': upcard,
+        'base': up['base'],
+        'up': (up['index'], up['action']),
+        'down': (down['index'], down['action']),
+        'evaluations': up['evaluations'] + down['evaluations'] - 1,     # True count 0 valued once, for both
+    }
+
+
+def deviation_table(rules, limit=10.0, workers=None):
+    """Index numbers for all starting hands against all up cards, valued across a pool of workers.
+        Return list of hand_indexes results, in chart order.
+    """
+    jobs = [(label, hand, up) for label, hand in starting_hands().items() for up in upcards]
+    results = {}
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = {
+            pool.submit(hand_indexes, rules.instreams, label, hand, up, limit): (label, up)
+            for label, hand, up in jobs
+        }
+        for i, future in enumerate(as_completed(futures)):
+            results[futures[future]] = res = future.result()
+            log(f'{i + 1} of {len(jobs)}: {res["hand"]} vs {res["upcard"]} done ({res["evaluations"]} evaluations)')
+    return [results[label, up] for label, hand, up in jobs]
+
+
+if __name__ == '__main__':
+    r = Rules()
+    start = datetime.now()
+    if len(sys.argv) > 2:
+        rows = [hand_indexes(r.instreams, sys.argv[1], sys.argv[1], sys.argv[2], 10.0)]
+    else:
+        rows = deviation_table(r)
+    elapsed = (datetime.now() - start).total_seconds()
+    print()
+    print(f'{r}:')
+    for row in rows:
+        devs = [
+            f'{action} at TC{index:+.2f}' for index, action in [row['down'], row['up']] if index is not None
+        ]
+        if devs:
+            print(f'{row["hand"]:>4} vs {row["upcard"]}: {row["base"]:9s} {", ".join(devs)}')
+    log(f'{len(rows)} hands, {sum(row["evaluations"] for row in rows)} evaluations, {elapsed:.1f} sec')
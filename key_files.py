@@ -0,0 +1,62 @@
+"""One-time rename of saved state files from full state names to state key names (see state_key.py)."""
+import json
+import os
+
+from config import card_indexes, home_dir, log
+from rules import Rules
+from state_key import encode, key_name
+
+
+def hand_instreams(hand_state):
+    counts = [0] * len(card_indexes)
+    for c in hand_state['cards']:
+        counts[card_indexes[c]] += 1
+    return (
+        tuple(counts),
+        hand_state['surrendered'],
+        hand_state['split_card'],
+        hand_state['split_count'],
+        hand_state['doubled'],
+        hand_state['stand'],
+    )
+
+
+def rename_all_files_under(rules, true_count_dir):
+    log(true_count_dir)
+    for dirpath, dirnames, filenames in os.walk(true_count_dir):
+        sub_dir = dirpath.replace('\\', '/')
+        for f in filenames:
+            if ' ' not in f:
+                continue
+            fpath = f'{sub_dir}/{f}'
+            with open(fpath, 'r') as fp:
+                data = json.load(fp)
+            key = encode(
+                rules.instreams,
+                hand_instreams(data['dealer']),
+                hand_instreams(data['player']),
+                data['shoe']['true_count'],
+            )
+            new_fpath = f'{sub_dir}/{key_name(key)}.json'
+            log(f'{fpath:60} --> {new_fpath}')
+            os.replace(fpath, new_fpath)
+
+
+def walk_tree(rules):
+    base_dir = f'{home_dir}/states/{rules.implied_name}'
+    for tc_dir in os.listdir(base_dir):
+        rename_all_files_under(rules, f'{base_dir}/{tc_dir}')
+
+
+if __name__ == '__main__':
+    r = Rules(
+        blackjack_pays=1.5,
+        shoe_decks=8,
+        hit_soft_17=True,
+        double_allowed='Any2',
+        splits_allowed=3,
+        double_after_split=True,
+        resplit_aces=False,
+        late_surrender=True,
+    )
+    walk_tree(rules=r)
@@ -0,0 +1,368 @@
+"""Monte Carlo estimate of the value of a Deal state, playing many rounds at once with NumPy arrays.
+
+Each round starts from the state's shoe (Shoe.counts: true count adjusted, cards out removed)
+and its hands, deals whatever of the initial cards are still to come, and is played out under a policy.
+Rounds are played in batches, one array element per round. A round's hands are played one at a time,
+as at the table: hand (slot) 0 first, then any hands split off from it, in order, each in the next free slot;
+all rounds' hands in a slot are played together, each drawing from its own round's shoe.
+
+A policy is a function taking a dict of arrays, one element per hand to act on:
+    counts          (n, 10) card counts, ranks as in config.card_indexes
+    total, soft, num_cards, pair_rank (-1 if not a pair), split_count (splits so far in the round),
+    split_card (rank, -1 if none), upcard (rank), true_count
+    can_surrender, can_split, can_double, can_hit
+and returning an array of action codes (indexes into actions), each allowed for its hand.
+Unlike Deal states, the game here follows all the rules (late surrender, double allowed) as dealt,
+and split hands are played out for real, rather than as copies of one hand.
+"""
+from datetime import datetime
+import sys
+
+import numpy as np
+
+from config import card_indexes, card_symbols, card_values, log
+from deal import Deal
+
+
+actions = ['Surrender', 'Split', 'Double', 'Hit', 'Stand']
+SURRENDER, SPLIT, DOUBLE, HIT, STAND = range(len(actions))
+rank_values = np.array(card_values[:10])
+ACE = card_indexes['A']
+TEN = card_indexes['T']
+
+
+class Hands:
+    """The hands in one slot of every round in a batch."""
+    def __init__(self, n):
+        self.active = np.zeros(n, dtype=bool)
+        self.done = np.zeros(n, dtype=bool)
+        self.counts = np.zeros((n, 10), dtype=np.int8)
+        self.hard = np.zeros(n, dtype=np.int16)
+        self.num_cards = np.zeros(n, dtype=np.int16)
+        self.split_card = np.full(n, -1, dtype=np.int8)
+        self.doubled = np.zeros(n, dtype=bool)
+        self.surrendered = np.zeros(n, dtype=bool)
+
+    def add(self, rows, ranks):
+        self.counts[rows, ranks] += 1
+        self.hard[rows] += rank_values[ranks]
+        self.num_cards[rows] += 1
+        self.done[rows] |= self.total[rows] >= 21
+
+    @property
+    def total(self):
+        return totals(self.hard, self.counts[:, ACE] > 0)
+
+
+def totals(hard, aces):
+    return np.where(aces & (hard <= 11), hard + 10, hard)
+
+
+def draw(shoe, rows, rng, excluded=None):
+    """Draw a card for each of rows from its round's shoe (counts, adjusted in place); return their ranks.
+        excluded: rank, per row, known not to be drawn (-1 for none).
+    """
+    counts = np.maximum(shoe[rows], 0)
+    if excluded is not None:
+        counts[excluded == ACE, ACE] = 0
+        counts[excluded == TEN, TEN] = 0
+    cum = counts.cumsum(axis=1)
+    u = rng.random(len(rows)) * cum[:, -1]
+    ranks = np.minimum((cum <= u[:, None]).sum(axis=1), 9)
+    shoe[rows, ranks] -= 1
+    return ranks
+
+
+def simulate(deal, policy, rounds=1000000, batch_size=100000, seed=None, first_action=None):
+    """Estimate the value of deal to Player, playing rounds under policy.
+        first_action: if given, the action Player takes at the state's first decision, whatever the policy says
+            (e.g. to check one action's value from Deal.valuation); it must be allowed there.
+        Return dict of 'value', its standard error 'stderr', 95% confidence interval 'ci95', and 'rounds'.
+    """
+    if deal.player.split_count or deal.dealer.num_cards > 2:
+        raise ValueError(f'Only states before any split, with Dealer yet to play: {deal}')
+    rng = np.random.default_rng(seed)
+    total = total_sq = 0.0
+    done = 0
+    while done < rounds:
+        n = min(batch_size, rounds - done)
+        payoffs = play_batch(deal, policy, n, rng, first_action)
+        total += payoffs.sum()
+        total_sq += (payoffs ** 2).sum()
+        done += n
+    value = total / done
+    stderr = np.sqrt(max(total_sq / done - value ** 2, 0) / done)
+    return {
+        'value': value,
+        'stderr': stderr,
+        'ci95': (value - 1.96 * stderr, value + 1.96 * stderr),
+        'rounds': done,
+    }
+
+
+def play_batch(deal, policy, n, rng, first_action=None, shoe=None, true_count=None):
+    """Play n rounds from deal's state; return array of payoffs to Player, one per round.
+        shoe: (n, 10) counts to deal from instead of deal's shoe, adjusted in place as cards are dealt.
+        true_count: per round, as seen by the policy, instead of deal's.
+    """
+    rules = deal.rules
+    if shoe is None:
+        shoe = np.tile(np.array(deal.shoe.counts[:10], dtype=float), (n, 1))
+    if true_count is None:
+        true_count = np.full(n, float(deal.shoe.true_count))
+    rows = np.arange(n)
+    max_hands = rules.splits_allowed + 1
+    slots = [Hands(n) for i in range(max_hands)]
+    player = slots[0]
+    player.active[:] = True
+    player.counts[:] = deal.player.counts[:10]
+    player.hard[:] = deal.player.hard_total
+    player.num_cards[:] = deal.player.num_cards
+    player.doubled[:] = deal.player.doubled
+    player.surrendered[:] = deal.player.surrendered
+    player.done[:] = deal.player.surrendered or deal.player.doubled or deal.player.stand
+    dealer = Hands(n)
+    dealer.counts[:] = deal.dealer.counts[:10]
+    dealer.hard[:] = deal.dealer.hard_total
+    dealer.num_cards[:] = deal.dealer.num_cards - deal.dealer.counts[card_indexes['x']]
+    hole_unknown = deal.dealer.counts[card_indexes['x']] > 0    # Down card not Blackjack, but yet to be seen
+
+    # Initial deal, as far as it's still to come: Player, Dealer up, Player, Dealer down
+    if deal.player.num_cards == 0:
+        player.add(rows, draw(shoe, rows, rng))
+    if deal.dealer.num_cards == 0:
+        upcard = draw(shoe, rows, rng)
+        dealer.add(rows, upcard)
+    else:
+        upcard = np.full(n, card_indexes[deal.dealer.cards[0]])
+    if deal.player.num_cards <= 1:
+        player.add(rows, draw(shoe, rows, rng))
+    if deal.dealer.num_cards <= 1:
+        dealer.add(rows, draw(shoe, rows, rng))
+
+    # Blackjacks settle the round at once
+    payoff = np.zeros(n)
+    player_bj = (player.num_cards == 2) & (player.total == 21)
+    dealer_bj = (dealer.num_cards == 2) & (dealer.total == 21)
+    payoff[player_bj & ~dealer_bj] = rules.blackjack_pays
+    payoff[dealer_bj & ~player_bj] = -1.0
+    over = player_bj | dealer_bj
+    player.done |= over
+
+    # Player plays each slot's hands in turn
+    splits = np.zeros(n, dtype=np.int8)
+    num_hands = np.ones(n, dtype=np.int8)
+    forced = first_action
+    for s, hand in enumerate(slots):
+        while True:
+            live = np.flatnonzero(hand.active & ~hand.done)
+            if len(live) == 0:
+                break
+            short = live[hand.num_cards[live] < 2]     # Split hands get their second card first
+            if len(short):
+                hand.add(short, draw(shoe, short, rng))
+                continue
+            view = hand_view(rules, hand, live, splits, upcard, true_count)
+            acts = policy(view)
+            if forced is not None:
+                acts = np.full(len(live), actions.index(forced))
+                forced = None
+            check_actions(view, acts)
+            r = live[acts == SURRENDER]
+            hand.surrendered[r] = True
+            hand.done[r] = True
+            r = live[acts == STAND]
+            hand.done[r] = True
+            r = live[acts == HIT]
+            hand.add(r, draw(shoe, r, rng))
+            r = live[acts == DOUBLE]
+            hand.doubled[r] = True
+            hand.add(r, draw(shoe, r, rng))
+            hand.done[r] = True
+            r = live[acts == SPLIT]
+            if len(r):
+                rank = np.argmax(hand.counts[r], axis=1)
+                for k in range(s + 1, max_hands):
+                    new = r[num_hands[r] == k]
+                    new_rank = rank[num_hands[r] == k]
+                    slots[k].active[new] = True
+                    slots[k].add(new, new_rank)
+                    slots[k].split_card[new] = new_rank
+                hand.counts[r, rank] = 1
+                hand.hard[r] = rank_values[rank]
+                hand.num_cards[r] = 1
+                hand.split_card[r] = rank
+                splits[r] += 1
+                num_hands[r] += 1
+
+    # Dealer plays if any hand still stands to win or lose against the Dealer's total
+    stands = np.zeros(n, dtype=bool)
+    for hand in slots:
+        stands |= hand.active & ~hand.surrendered & (hand.total <= 21)
+    playing = np.flatnonzero(stands & ~over)
+    if hole_unknown and len(playing):
+        excluded = np.where(upcard[playing] == TEN, ACE, np.where(upcard[playing] == ACE, TEN, -1))
+        dealer.add(playing, draw(shoe, playing, rng, excluded))
+    while len(playing):
+        total, soft = dealer.total[playing], dealer.total[playing] != dealer.hard[playing]
+        hits = (total < 17) | (rules.hit_soft_17 & (total == 17) & soft)
+        playing = playing[hits]
+        if len(playing):
+            dealer.add(playing, draw(shoe, playing, rng))
+
+    # Settle each hand
+    dealer_total = dealer.total
+    for hand in slots:
+        settle = hand.active & ~over
+        bet = np.where(hand.doubled, 2.0, 1.0)
+        total = hand.total
+        win = (total <= 21) & ((dealer_total > 21) | (total > dealer_total))
+        lose = (total > 21) | ((dealer_total <= 21) & (total < dealer_total))
+        result = np.where(win, bet, np.where(lose, -bet, 0.0))
+        result = np.where(hand.surrendered, -0.5, result)
+        payoff += np.where(settle, result, 0.0)
+    return payoff
+
+
+def hand_view(rules, hand, live, splits, upcard, true_count):
+    """What the policy sees of hands at rows live, including which actions the rules allow."""
+    counts = hand.counts[live]
+    hard = hand.hard[live]
+    total = hand.total[live]
+    num_cards = hand.num_cards[live]
+    split_count = splits[live]
+    split_card = hand.split_card[live]
+    pair_rank = np.where((num_cards == 2) & (counts.max(axis=1) == 2), np.argmax(counts, axis=1), -1)
+    split_aces = split_card == ACE
+    can_double = (num_cards == 2) & ~split_aces & ((split_count == 0) | rules.double_after_split)
+    if rules.double_allowed == '9-11':
+        can_double &= (hard >= 9) & (hard <= 11)
+    elif rules.double_allowed == '10-11':
+        can_double &= (hard >= 10) & (hard <= 11)
+    return {
+        'counts': counts,
+        'total': total,
+        'soft': total != hard,
+        'num_cards': num_cards,
+        'pair_rank': pair_rank,
+        'split_count': split_count,
+        'split_card': split_card,
+        'upcard': upcard[live],
+        'true_count': true_count[live],
+        'can_surrender': (num_cards == 2) & (split_count == 0) & rules.late_surrender,
+        'can_split': (pair_rank >= 0) & (split_count < rules.splits_allowed) & (~split_aces | rules.resplit_aces),
+        'can_double': can_double,
+        'can_hit': ~split_aces,
+    }
+
+
+def check_actions(view, acts):
+    allowed = {
+        SURRENDER: view['can_surrender'],
+        SPLIT: view['can_split'],
+        DOUBLE: view['can_double'],
+        HIT: view['can_hit'],
+    }
+    for code, ok in allowed.items():
+        bad = (acts == code) & ~ok
+        if bad.any():
+            raise ValueError(f'Policy chose {actions[code]} where not allowed ({bad.sum()} hands)')
+
+
+def chart_policy(chart):
+    """Policy playing a basic strategy chart, in the form of checkout.strategy.
+        Surrender first (hard totals only), then pairs, then soft or hard totals;
+        Dh or Ds means Double if allowed, else Hit or Stand.
+    """
+    dealer_order = [card_indexes[c] for c in ['2', '3', '4', '5', '6', '7', '8', '9', 'T', 'A']]
+    codes = {'H': (HIT, HIT), 'S': (STAND, STAND), 'Dh': (DOUBLE, HIT), 'Ds': (DOUBLE, STAND)}
+    surrender = np.zeros((22, 10), dtype=bool)
+    split = np.zeros((10, 10), dtype=bool)
+    hard = np.zeros((22, 10, 2), dtype=np.int8)
+    hard[:17] = HIT
+    hard[17:] = STAND
+    soft = np.zeros((22, 10, 2), dtype=np.int8)
+    soft[:18] = HIT
+    soft[18:] = STAND
+    for case, plays in chart['Surrender'].items():
+        if case != 'Dlr':
+            surrender[int(case), dealer_order] = [p == 'Y' for p in plays]
+    for case, plays in chart['Pair'].items():
+        if case != 'Dlr':
+            split[card_indexes[case[0]], dealer_order] = [p == 'Y' for p in plays]
+    for case, plays in chart['Soft'].items():
+        if case != 'Dlr':
+            soft[11 + card_values[card_indexes[case[-1]]], dealer_order] = [codes[p] for p in plays]
+    for case, plays in chart['Hard'].items():
+        if case != 'Dlr':
+            hard[int(case), dealer_order] = [codes[p] for p in plays]
+
+    def policy(hands):
+        total, up = np.minimum(hands['total'], 21), hands['upcard']
+        play = np.where(hands['soft'][:, None], soft[total, up], hard[total, up])
+        acts = np.where(hands['can_double'] | (play[:, 0] != DOUBLE), play[:, 0], play[:, 1])
+        acts = np.where((acts == HIT) & ~hands['can_hit'], STAND, acts)
+        pair = np.maximum(hands['pair_rank'], 0)
+        acts = np.where(hands['can_split'] & split[pair, up], SPLIT, acts)
+        surr = hands['can_surrender'] & ~hands['soft'] & (hands['pair_rank'] < 0) & surrender[total, up]
+        return np.where(surr, SURRENDER, acts)
+
+    return policy
+
+
+def valuation_policy(rules, true_count=0):
+    """Policy playing the best action by Deal valuation (saved, or computed as needed) at true_count.
+        A split hand is looked up as the Deal state for it: its cards, with split card and split count.
+        Each distinct hand is looked up once, for its actions ranked by value. Deal states don't apply
+        double_allowed or late_surrender, so a hand plays the first of them the rules allow here (Stand at worst).
+    """
+    ranked = {}
+
+    def look_up(key):
+        counts, split_count, split_card, upcard = key[:10], key[10], key[11], key[12]
+        dealer = [0] * 11
+        dealer[upcard] = 1
+        dealer[card_indexes['x']] = 1
+        player = tuple(int(c) for c in counts) + (0,)
+        d = Deal(
+            rules=rules.instreams,
+            dealer=(tuple(dealer), False, '', 0, False, False),
+            player=(player, False, card_symbols[split_card] if split_card >= 0 else '', int(split_count), False, False),
+            true_count=true_count,
+        )
+        val = d.valuation_saved or d.valuation
+        codes = [actions.index(v['action']) for v in val if v['action'] in actions]
+        return codes + [STAND] * (len(actions) - len(codes))
+
+    def policy(hands):
+        keys = np.column_stack([hands['counts'], hands['split_count'], hands['split_card'], hands['upcard']])
+        uniq, inverse = np.unique(keys, axis=0, return_inverse=True)
+        for key in map(tuple, uniq):
+            if key not in ranked:
+                ranked[key] = look_up(key)
+        choices = np.array([ranked[key] for key in map(tuple, uniq)], dtype=np.int8)[inverse.ravel()]
+        allowed = np.column_stack([
+            hands['can_surrender'],
+            hands['can_split'],
+            hands['can_double'],
+            hands['can_hit'],
+            np.ones(len(choices), dtype=bool),
+        ])
+        ok = np.take_along_axis(allowed, choices, axis=1)
+        return choices[np.arange(len(choices)), ok.argmax(axis=1)]
+
+    return policy
+
+
+if __name__ == '__main__':
+    from checkout import strategy
+    from rules import Rules
+
+    cards = sys.argv[1] if len(sys.argv) > 1 else ''
+    num_rounds = int(float(sys.argv[2])) if len(sys.argv) > 2 else 1000000
+    r = Rules()
+    d = Deal.from_cards(cards, rules=r.instreams)
+    start = datetime.now()
+    res = simulate(d, chart_policy(strategy), rounds=num_rounds)
+    elapsed = (datetime.now() - start).total_seconds()
+    log(f'{d}: {res["value"]:+.5f} +/- {1.96 * res["stderr"]:.5f} ({res["rounds"]} rounds, {elapsed:.1f} sec)')
@@ -4,7 +4,13 @@ and which cache their calculated results automatically,
 but which enable clearing (invalidating) those cached results on demand or under desired circumstances.
 """
 import functools
+import heapq
 from inspect import signature
+import itertools
+import sys
+
+
+_sequence = itertools.count()       # Tie-break for heap entries of equal weight, so keys are never compared
 
 
 class CachedInstance(type):
@@ -16,50 +22,122 @@ class CachedInstance(type):
             etc.
         Treat all named arguments correctly, whether positional or explicitly named in the instantiation call.
         Ref: https://stackoverflow.com/questions/50820707/python-class-instances-unique-by-some-property
+
+        Each instance holds its own cache key, so removing it from cache is a single lookup, not a search.
+        A class may keep its instances apart, in its own _instances and _hits dicts; those aren't evicted.
     """
     _instances = {}
+    _hits = {}
+    _key_makers = {}        # Function forming a cache key from calling args, by class
+    _candidates = []        # Heap of (eviction weight, sequence, key) of objects that may be evicted; see evict
 
     def __call__(cls, *args, **kwargs):
-        """Use inspection to form an explicit dict of args by name,
-           whether those args are supplied positionally, or by name, or by default"""
-        explicit_args = {}
-        poppable_args = list(args)
-        for name, parm in signature(cls.__init__).parameters.items():
-            if name == 'self':
+        """Form an explicit dict of args by name, whether those args are supplied positionally,
+           or by name, or by default (see key_maker); return the instance for those args, new or cached.
+           A class may instead supply its own compact key from its args, as instance_key.
+           The key is set on the instance before its __init__ runs."""
+        make_key = CachedInstance._key_makers.get(cls)
+        if make_key is None:
+            make_key = CachedInstance._key_makers[cls] = key_maker(cls)
+        key = cls, make_key(args, kwargs)
+        obj = cls._instances.get(key)
+        if obj is None:
+            obj = cls.__new__(cls)
+            obj._cache_key = key            # Set before __init__, which may use it (e.g. Deal.key)
+            obj.__init__(*args, **kwargs)
+            cls._instances[key] = obj
+        else:
+            cls._hits[key] = cls._hits.get(key, 0) + 1
+        return obj
+
+    @staticmethod
+    def add_candidate(obj):
+        """Offer obj for eviction, once it reports an eviction weight (e.g. a state, once finished)."""
+        if obj.__dict__.get('_candidate'):
+            return
+        weight = obj.eviction_weight(CachedInstance._hits.get(obj._cache_key, 0))
+        if weight is not None:
+            obj._candidate = True
+            heapq.heappush(CachedInstance._candidates, (weight, next(_sequence), obj._cache_key))
+
+    @staticmethod
+    def evict(count):
+        """Remove up to count objects from cache, least valuable first, for memory cleanup.
+            Candidates are those offered by add_candidate, kept in a heap by eviction weight (given the number
+            of times each was reused). Weights only grow, with reuse, so the heap is brought up to date lazily:
+            an object whose weight has grown since it went in goes back in at its new weight.
+            An object still referenced from outside the cache (e.g. a parent's next_states) isn't evicted:
+            it wouldn't be freed, and a later lookup would make it again.
+            Return the number evicted.
+        """
+        heap = CachedInstance._candidates
+        kept = []
+        evicted = 0
+        while heap and evicted < count:
+            entry = heapq.heappop(heap)
+            key = entry[2]
+            obj = CachedInstance._instances.get(key)
+            if obj is None:
+                continue            # Released since
+            weight = obj.eviction_weight(CachedInstance._hits.get(key, 0))
+            if weight is None:
+                obj._candidate = False
+                continue
+            if weight > entry[0]:
+                heapq.heappush(heap, (weight, entry[1], key))
+                continue
+            if sys.getrefcount(obj) > 3:     # Here: the cache's, obj's and getrefcount's own
+                kept.append(entry)
                 continue
-            if len(poppable_args):
-                val = poppable_args.pop(0)
-            elif name in kwargs:
-                val = kwargs[name]
-            else:
-                val = parm.default
-            explicit_args[name] = val
-        # Class itself plus explicit dict of args in alpha order form a key which defines object uniqueness
-        key = cls, tuple(sorted(explicit_args.items()))
-        if key not in cls._instances:
-            cls._instances[key] = super(CachedInstance, cls).__call__(*args, **kwargs)
-        return cls._instances[key]
+            del CachedInstance._instances[key]
+            CachedInstance._hits.pop(key, None)
+            evicted += 1
+        for entry in kept:
+            heapq.heappush(heap, entry)
+        if len(heap) > 2 * len(CachedInstance._instances):
+            # Drop entries for objects released since (e.g. by Deal.release), so the heap doesn't outgrow the cache
+            heap[:] = [e for e in heap if e[2] in CachedInstance._instances]
+            heapq.heapify(heap)
+        return evicted
 
     @staticmethod
     def pop_reference(obj):
         """Enable an object instance to have itself removed from cache, for memory cleanup"""
-        key = None
-        for k, o in CachedInstance._instances.items():
-            if o == obj:
-                key = k
-        if key:
+        key = getattr(obj, '_cache_key', None)
+        if CachedInstance._instances.get(key) is obj:
             del CachedInstance._instances[key]
+        CachedInstance._hits.pop(key, None)
+
+
+def key_maker(cls):
+    """Return function forming the cache key for cls from calling args and kwargs, as CachedInstance.__call__ does.
+        The signature is inspected once here, rather than on every instantiation.
+    """
+    if hasattr(cls, 'instance_key'):
+        return lambda args, kwargs: cls.instance_key(*args, **kwargs)
+    params = [(name, parm.default) for name, parm in signature(cls.__init__).parameters.items() if name != 'self']
+    order = sorted(range(len(params)), key=lambda i: params[i][0])    # Args in alpha order
+
+    def make_key(args, kwargs):
+        vals = list(args[:len(params)]) + [kwargs.get(name, default) for name, default in params[len(args):]]
+        return tuple((params[i][0], vals[i]) for i in order)
+
+    return make_key
 
 
 class Node(metaclass=CachedInstance):
     """Base class for forming nodes in an evaluation graph. All classes should inherit this Node class."""
     @property
     def cached_methods(self):
-        return {vt for vt in self.value_types if isinstance(self.__class__.__dict__[vt], functools._lru_cache_wrapper)}
+        return cached_types(self.__class__)[0]
 
     @property
     def cached_properties(self):
-        return {vt for vt in self.value_types if isinstance(self.__class__.__dict__[vt], functools.cached_property)}
+        return cached_types(self.__class__)[1]
+
+    def eviction_weight(self, hits):
+        """Value of keeping this object in cache, or None if it must stay; see CachedInstance.evict"""
+        return None
 
     def clear(self):
         for vt in self.value_types:
@@ -81,3 +159,13 @@ class Node(metaclass=CachedInstance):
     @property
     def value_types(self):
         return [m for m in self.__class__.__dict__.keys() if not m.startswith('_')]
+
+
+@functools.cache
+def cached_types(cls):
+    """Names of cls's cached methods and of its cached properties, found once per class."""
+    types = {vt: cls.__dict__[vt] for vt in cls.__dict__ if not vt.startswith('_')}
+    return (
+        {vt for vt, t in types.items() if isinstance(t, functools._lru_cache_wrapper)},
+        {vt for vt, t in types.items() if isinstance(t, functools.cached_property)},
+    )
@@ -0,0 +1,64 @@
+"""Value a single rules/true count run across processes.
+
+Below the root Deal, the first three cards dealt (Player card, Dealer up card, Player card) lead to
+independent subtrees: 10 Dealer up cards by 100 ordered Player starts, 550 distinct states once
+transpositions (e.g. 6 then T vs. T then 6) are merged. Each of those shards is valued in a worker process;
+their valuations are then set on the shard states here, and the root is valued as usual,
+weighting each shard by the card probabilities of the Deal chance nodes above it.
+"""
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import sys
+
+from config import log
+from deal import Deal, pool_job
+
+
+def shard_states(deal, depth=3):
+    """Return dict of distinct states, by key, reached from deal by dealing depth more cards."""
+    states = {deal.key: deal}
+    for i in range(depth):
+        next_states = {}
+        for state in states.values():
+            for action, card, prob, child in state.iter_next_states():
+                next_states[child.key] = child
+        states = next_states
+    return states
+
+
+@pool_job
+def value_shard(rules, dealer, player, true_count):
+    deal = Deal(rules=rules, dealer=dealer, player=player, true_count=true_count)
+    val = deal.valuation
+    return deal.key, val
+
+
+def parallel_valuation(deal, workers=None):
+    """Value deal with its shards spread over a pool of workers (default: one per CPU)."""
+    shards = shard_states(deal)
+    todo = [s for s in shards.values() if 'valuation' not in s.__dict__ and not s.valuation_is_saved]
+    log(f'{deal}: {len(shards)} shards, {len(todo)} to value...')
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [
+            pool.submit(
+                value_shard,
+                s.rules.instreams,
+                s.dealer.instreams,
+                s.player.instreams,
+                s.shoe.true_count,
+            ) for s in todo
+        ]
+        for i, future in enumerate(as_completed(futures)):
+            key, val = future.result()
+            shards[key].__dict__['valuation'] = val
+            log(f'Shard {i + 1} of {len(todo)} done: {shards[key]} ({val[0]["nodes"]} nodes)')
+    return deal.valuation
+
+
+if __name__ == '__main__':
+    tc = 0
+    if len(sys.argv) > 1:
+        tc = float(sys.argv[1])
+    d = Deal(true_count=tc)
+    v = parallel_valuation(d)
+    d.save(save_valuation=True)
+    log(f'{d}: {v}')
@@ -1,4 +1,16 @@
-class Rules:
+from functools import cached_property
+
+from node import Node
+
+
+class Rules(Node):
+    """One instance per distinct set of rules (see node.CachedInstance), shared by every Deal using them;
+        so once made, its rules can't be changed.
+        Interned apart from Deal states, so they don't count toward the state cache size or its eviction.
+    """
+    _instances = {}
+    _hits = {}
+
     def __init__(
         self,
         blackjack_pays=1.5,
@@ -19,10 +31,38 @@ class Rules:
         self.resplit_aces = resplit_aces
         self.late_surrender = late_surrender
 
+    def __setattr__(self, name, value):
+        if name in self.__dict__:
+            raise AttributeError(f'Rules are shared, and can\'t be changed: {name}')
+        super().__setattr__(name, value)
+
     def __str__(self):
         return self.implied_name
 
-    @property
+    @staticmethod
+    def instance_key(
+        blackjack_pays=1.5,
+        shoe_decks=6,
+        hit_soft_17=False,
+        double_allowed='Any2',
+        splits_allowed=3,
+        double_after_split=True,
+        resplit_aces=False,
+        late_surrender=True,
+    ):
+        """Unique by instreams, which is quicker to form than the general key from args."""
+        return (
+            blackjack_pays,
+            shoe_decks,
+            hit_soft_17,
+            double_allowed,
+            splits_allowed,
+            double_after_split,
+            resplit_aces,
+            late_surrender,
+        )
+
+    @cached_property
     def implied_name(self):
         rules = [
             'BJ',
@@ -37,7 +77,7 @@ class Rules:
         ]
         return '-'.join(rules)
 
-    @property
+    @cached_property
     def instreams(self):
         return (
             self.blackjack_pays,
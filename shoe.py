@@ -1,4 +1,16 @@
+"""Shoe composition and card probabilities depend only on decks, true count and the cards removed,
+and many Deal states share those-- every order in which the same cards came out, every Player action
+that doesn't take a card. So they're computed once per (decks, true count, removed) in the cached
+module functions below, and shared: the dicts returned must not be modified. The caches are bounded,
+least recently used dropped first, and are cleared when process memory is over budget (see Deal.manage_cache).
+Likewise the full shoe before any cards are dealt, a ShoeBase, is made once per (decks, true count).
+"""
+from functools import cached_property, lru_cache
+
+import numpy as np
+
 from config import card_symbols, card_indexes
+from node import Node
 
 
 class Shoe:
@@ -6,28 +18,11 @@ class Shoe:
         self.deal = deal
         self.true_count = true_count
         self.decks = deal.rules.shoe_decks
+        self.base = ShoeBase(self.decks, true_count)
 
     @property
     def base_count(self):
-        rank_count = self.decks * 4
-        ten_count = rank_count * 4
-        unknown_count = 0
-        counts = [
-            rank_count,             # 2s
-            rank_count,             # 3s
-            rank_count,             # 4s
-            rank_count,             # 5s
-            rank_count,             # 6s
-            rank_count,             # 7s
-            rank_count,             # 8s
-            rank_count,             # 9s
-            ten_count,              # Ts
-            rank_count,             # As
-            unknown_count,          # Down cards
-        ]
-        for i in range(len(counts)):
-            counts[i] -= self.true_count_adjust[i]
-        return counts
+        return list(self.base.counts_list)
 
     @property
     def cards(self):
@@ -48,53 +43,145 @@ class Shoe:
 
     @property
     def counts(self):
-        c = self.base_count.copy()
-        for i, count in enumerate(self.cards_out):
-            c[i] -= count
-        return c
+        return list(composition(self.decks, self.true_count, self.removed))
 
     @property
     def num_cards(self):
-        return sum(self.counts)
+        return sum(composition(self.decks, self.true_count, self.removed))
 
     @property
     def pdf(self):
-        probs = [self.counts[i] / self.num_cards if self.num_cards != 0 else 0 for i in card_indexes.values()]
-        return dict(zip(card_symbols, probs))
+        return card_pdf(self.decks, self.true_count, self.removed)
+
+    @cached_property
+    def removed(self):
+        """cards_out as a tuple, for use as a cache key; a Deal's hands don't change, so neither does this."""
+        return tuple(self.cards_out)
 
     @property
     def true_count_adjust(self):
-        """There are 10 ranks in a deck that contribute 1 or -1 to the count for the deck:
-            2, 3, 4, 5, 6 are +1
-            T, J, Q, K, A are -1
-        So to change the true (per deck) count by exactly 1, we modify the count
-        of each rank that contributes by 1/10 times the number of decks in the shoe.
-
-        For example, to change the true count of a 6-deck shoe to +1, we would modify the rank counts as follows:
-            2, 3, 4, 5, 6 start with rank counts 24 each.
-                Adjust each by +6/10, for total adjustment of +6/10 * 5 or +3
-            T, J, Q, K, A start with rank counts 96 for Ts and 24 for As.
-                Adjust Ts by +6/10 * 4 or +2.4
-                Adjust As by +6/10 or +0.6
-
-        Total adjustment then is +3 +2.4 +0.6 = +6, for a 6-deck true count of +1.
-        """
-        base_adjustment = self.decks * self.true_count / 10.0
-        adjs = [
-            base_adjustment,        # 2s
-            base_adjustment,        # 3s
-            base_adjustment,        # 4s
-            base_adjustment,        # 5s
-            base_adjustment,        # 6s
-            0,                      # 7s
-            0,                      # 8s
-            0,                      # 9s
-            -base_adjustment * 4,   # Ts
-            -base_adjustment,       # As
-            0,                      # Down cards
-        ]
-        return adjs
+        return list(self.base.adjust)
+
+
+class ShoeBase(Node):
+    """The shoe for decks at true_count before any cards are dealt: one instance per (decks, true count)
+        (see node.CachedInstance), shared by every Shoe of a run. Don't modify.
+        Interned apart from Deal states, as Rules are.
+    """
+    _instances = {}
+    _hits = {}
+
+    def __init__(self, decks, true_count=0):
+        self.decks = decks
+        self.true_count = true_count
+        self.adjust = tuple(true_count_adjust(decks, true_count))
+        self.counts_list = tuple(base_counts(decks, true_count))
+        self.counts = np.array(self.counts_list)
+        self.counts.flags.writeable = False
+
+    @staticmethod
+    def instance_key(decks, true_count=0):
+        return decks, true_count
+
+
+def base_counts(decks, true_count=0):
+    """Count of each rank in a full shoe of this many decks, adjusted to the true count."""
+    rank_count = decks * 4
+    ten_count = rank_count * 4
+    unknown_count = 0
+    counts = [
+        rank_count,             # 2s
+        rank_count,             # 3s
+        rank_count,             # 4s
+        rank_count,             # 5s
+        rank_count,             # 6s
+        rank_count,             # 7s
+        rank_count,             # 8s
+        rank_count,             # 9s
+        ten_count,              # Ts
+        rank_count,             # As
+        unknown_count,          # Down cards
+    ]
+    adjs = true_count_adjust(decks, true_count)
+    for i in range(len(counts)):
+        counts[i] -= adjs[i]
+    return counts
+
+
+@lru_cache(maxsize=1 << 16)
+def card_pdf(decks, true_count, removed, excluded=''):
+    """Probability of each rank being the next card, from the shoe with removed cards out.
+        If excluded, that rank is known not to be next (e.g. Dealer down card, no Dealer Blackjack);
+        it's dropped and the rest reweighted.
+    """
+    if excluded:
+        pdf = card_pdf(decks, true_count, removed)
+        adj_factor = pdf[excluded]
+        return {c: p / (1 - adj_factor) for c, p in pdf.items() if c != excluded}
+    counts = composition(decks, true_count, removed)
+    num_cards = sum(counts)
+    probs = [counts[i] / num_cards if num_cards != 0 else 0 for i in card_indexes.values()]
+    return dict(zip(card_symbols, probs))
+
+
+@lru_cache(maxsize=1 << 16)
+def composition(decks, true_count, removed):
+    """Count of each rank left in the shoe with removed cards out, as a tuple."""
+    return tuple((ShoeBase(decks, true_count).counts - removed).tolist())
+
+
+@lru_cache(maxsize=1 << 12)
+def down_card_pdf(decks, true_count, removed, upcard):
+    """Dealing the Dealer down card: with a T or A up, it either makes Blackjack (hand over) or is unknown (x);
+        otherwise it's unknown.
+    """
+    pdf = card_pdf(decks, true_count, removed)
+    if upcard == 'T':
+        return {
+            'A': pdf['A'],
+            'x': 1 - pdf['A'],
+        }
+    if upcard == 'A':
+        return {
+            'T': pdf['T'],
+            'x': 1 - pdf['T'],
+        }
+    return {
+        'x': 1.0,
+    }
+
+
+def true_count_adjust(decks, true_count=0):
+    """There are 10 ranks in a deck that contribute 1 or -1 to the count for the deck:
+        2, 3, 4, 5, 6 are +1
+        T, J, Q, K, A are -1
+    So to change the true (per deck) count by exactly 1, we modify the count
+    of each rank that contributes by 1/10 times the number of decks in the shoe.
+
+    For example, to change the true count of a 6-deck shoe to +1, we would modify the rank counts as follows:
+        2, 3, 4, 5, 6 start with rank counts 24 each.
+            Adjust each by +6/10, for total adjustment of +6/10 * 5 or +3
+        T, J, Q, K, A start with rank counts 96 for Ts and 24 for As.
+            Adjust Ts by +6/10 * 4 or +2.4
+            Adjust As by +6/10 or +0.6
 
+    Total adjustment then is +3 +2.4 +0.6 = +6, for a 6-deck true count of +1.
+    """
+    base_adjustment = decks * true_count / 10.0
+    adjs = [
+        base_adjustment,        # 2s
+        base_adjustment,        # 3s
+        base_adjustment,        # 4s
+        base_adjustment,        # 5s
+        base_adjustment,        # 6s
+        0,                      # 7s
+        0,                      # 8s
+        0,                      # 9s
+        -base_adjustment * 4,   # Ts
+        -base_adjustment,       # As
+        0,                      # Down cards
+    ]
+    return adjs
 
 if __name__ == '__main__':
     pass
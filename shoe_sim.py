@@ -0,0 +1,183 @@
+"""Full-shoe simulation: real shoes dealt down to the cut card, counted with Hi-Lo as they go.
+
+Shoe.true_count_adjust models a true count as a static shoe composition; here instead shoes are shuffled,
+dealt round after round until the cut card (penetration) comes out, then reshuffled, as at the table.
+That shows how often each true count comes up, and what Player makes at each, playing a strategy
+that varies with the count.
+
+Many shoes are dealt at once, one array row per shoe, each round played by monte_carlo.play_batch.
+Before each round, each shoe's Hi-Lo running count (+1 for 2-6, -1 for T and A, over the cards out)
+is divided by decks remaining for its true count; the round's payoff is tallied under that true count,
+floored to a whole number (TC +2 is 2 <= true count < 3). Workers each deal their own shoes,
+in separate processes, and their tallies are summed.
+
+The strategy played is a chart per true count, in the form of checkout.strategy; each hand is played
+by the chart for the true count nearest its own. strategy_charts builds them from saved valuations
+the way show_strategy does, so the deviations played are those it shows.
+"""
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+import os
+import sys
+
+import numpy as np
+
+from config import card_indexes, card_values, log
+from deal import Deal
+from monte_carlo import chart_policy, play_batch
+from rules import Rules
+from shoe import base_counts
+
+
+hi_lo = np.array([1, 1, 1, 1, 1, 0, 0, 0, -1, -1])     # By rank, as in config.card_indexes
+dealer_cols = ['2x', '3x', '4x', '5x', '6x', '7x', '8x', '9x', 'Tx', 'Ax']
+
+
+def simulate_shoes(rules, policy, rounds, shoes=10000, penetration=0.75, seed=None):
+    """Deal rounds, spread over shoes dealt in parallel, playing policy (see monte_carlo) against each.
+        Return tally dict, by floored true count, of dicts of 'rounds', 'total' and 'total_sq' (of payoffs).
+    """
+    if not 0 < penetration < 1:
+        raise ValueError(f'Penetration must be a fraction of the shoe: {penetration}')
+    rng = np.random.default_rng(seed)
+    deal = Deal(rules=rules.instreams)
+    full = np.array(base_counts(rules.shoe_decks)[:10], dtype=float)
+    cut = full.sum() * (1 - penetration)
+    shoe = np.tile(full, (shoes, 1))
+    tally = {}
+    done = 0
+    while done < rounds:
+        n = min(shoes, rounds - done)
+        running = (full - shoe[:n]) @ hi_lo
+        true_count = running / (shoe[:n].sum(axis=1) / 52)
+        payoff = play_batch(deal, policy, n, rng, shoe=shoe[:n], true_count=true_count)
+        bucket = np.floor(true_count).astype(int)
+        low = bucket.min()
+        rounds_by = np.bincount(bucket - low)
+        total_by = np.bincount(bucket - low, weights=payoff)
+        total_sq_by = np.bincount(bucket - low, weights=payoff ** 2)
+        for i in np.flatnonzero(rounds_by):
+            t = tally.setdefault(int(low + i), {'rounds': 0, 'total': 0.0, 'total_sq': 0.0})
+            t['rounds'] += int(rounds_by[i])
+            t['total'] += total_by[i]
+            t['total_sq'] += total_sq_by[i]
+        shoe[shoe.sum(axis=1) < cut] = full   # Cut card out: reshuffle
+        done += n
+    return tally
+
+
+def simulate_worker(rules, charts, rounds, shoes, penetration, seed):
+    return simulate_shoes(Rules(*rules), deviation_policy(charts), rounds, shoes, penetration, seed)
+
+
+def parallel_simulation(rules, charts, rounds, shoes=10000, penetration=0.75, workers=None, seed=None):
+    """Simulate rounds split over a pool of workers (default: one per CPU), playing charts (see deviation_policy).
+        Return summed tally, as from simulate_shoes.
+    """
+    workers = workers or os.cpu_count()
+    seeds = np.random.SeedSequence(seed).spawn(workers)
+    shares = [rounds // workers + (1 if i < rounds % workers else 0) for i in range(workers)]
+    tally = {}
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [
+            pool.submit(simulate_worker, rules.instreams, charts, share, shoes, penetration, s)
+            for share, s in zip(shares, seeds) if share
+        ]
+        for future in futures:
+            for tc, t in future.result().items():
+                sums = tally.setdefault(tc, {'rounds': 0, 'total': 0.0, 'total_sq': 0.0})
+                for k in sums:
+                    sums[k] += t[k]
+    return tally
+
+
+def summary(tally):
+    """Return list of dicts, by true count ascending: 'true_count', 'rounds', 'freq', 'ev', 'stderr'."""
+    all_rounds = sum(t['rounds'] for t in tally.values())
+    rows = []
+    for tc in sorted(tally):
+        t = tally[tc]
+        ev = t['total'] / t['rounds']
+        rows.append({
+            'true_count': tc,
+            'rounds': t['rounds'],
+            'freq': t['rounds'] / all_rounds,
+            'ev': ev,
+            'stderr': np.sqrt(max(t['total_sq'] / t['rounds'] - ev ** 2, 0) / t['rounds']),
+        })
+    return rows
+
+
+def deviation_policy(charts):
+    """Policy playing, for each hand, the chart (checkout.strategy form) for the true count nearest its own.
+        charts: dict of charts by true count
+    """
+    tcs = np.array(sorted(charts))
+    policies = [chart_policy(charts[tc]) for tc in tcs]
+    if len(policies) == 1:
+        return policies[0]
+
+    def policy(hands):
+        nearest = np.abs(hands['true_count'][:, None] - tcs[None, :]).argmin(axis=1)
+        acts = np.zeros(len(nearest), dtype=np.int8)
+        for i in np.unique(nearest):
+            rows = nearest == i
+            acts[rows] = policies[i]({k: v[rows] for k, v in hands.items()})
+        return acts
+
+    return policy
+
+
+def chart_from_frame(df):
+    """Chart in checkout.strategy form from one true count's frame from show_strategy.calc_strategies_by_true_count.
+        Hands the frame leaves out play as chart_policy defaults; a row with a cell missing is left out too.
+        Double (D) falls back to Stand on soft 18 and up, otherwise to Hit.
+    """
+    chart = {section: {'Dlr': [c[0] for c in dealer_cols]} for section in ['Pair', 'Soft', 'Hard', 'Surrender']}
+    for (hand_type, label, distinct), row in df.iterrows():
+        plays = [row[col] for col in dealer_cols]
+        if any(not isinstance(p, str) for p in plays):
+            continue
+        hand_type = hand_type.strip()
+        if hand_type == 'Pairs':
+            chart['Pair'].setdefault(f'{label[0]},{label[1]}', ['Y' if p == 'Y' else 'N' for p in plays])
+        elif hand_type == 'Soft Totals':
+            double = 'Ds' if 11 + card_values[card_indexes[label[-1]]] >= 18 else 'Dh'
+            chart['Soft'].setdefault(f'A,{label[-1]}', [double if p == 'D' else p for p in plays])
+        elif hand_type == 'Hard Totals':
+            chart['Hard'].setdefault(label, ['Dh' if p == 'D' else p for p in plays])
+        elif hand_type == 'Surrender':
+            chart['Surrender'].setdefault(label, ['Y' if p == 'Su' else 'N' for p in plays])
+    return chart
+
+
+def strategy_charts(rules):
+    """Charts by true count, from saved valuations, as show_strategy finds them; basic strategy if none are saved."""
+    import show_strategy
+
+    true_counts = show_strategy.find_complete_true_counts(rules)
+    if not true_counts:
+        from checkout import strategy
+        log(f'No saved valuations for {rules}; playing basic strategy')
+        return {0.0: strategy}
+    frames = show_strategy.starting_hands(rules=rules, true_counts=true_counts)
+    results = show_strategy.collect_data(frames)
+    strategies = show_strategy.calc_strategies_by_true_count(results)
+    return {tc: chart_from_frame(df) for tc, df in strategies.items()}
+
+
+if __name__ == '__main__':
+    num_rounds = int(float(sys.argv[1])) if len(sys.argv) > 1 else 10000000
+    pen = float(sys.argv[2]) if len(sys.argv) > 2 else 0.75
+    r = Rules()
+    start = datetime.now()
+    tallies = parallel_simulation(r, strategy_charts(r), num_rounds, penetration=pen)
+    elapsed = (datetime.now() - start).total_seconds()
+    print()
+    print(f'{r}, penetration {pen:.0%}:')
+    print(f'{"TC":>4} {"Rounds":>12} {"Freq":>8} {"EV":>9} {"+/-":>8}')
+    rows = summary(tallies)
+    for row in rows:
+        print(f'{row["true_count"]:+4d} {row["rounds"]:12d} {row["freq"]:8.2%} {row["ev"]:+9.4f} {1.96 * row["stderr"]:8.4f}')
+    overall = sum(row['freq'] * row['ev'] for row in rows)
+    log(f'{num_rounds} rounds, overall EV {overall:+.5f}, {elapsed:.1f} sec ({num_rounds / elapsed * 3600:.3g} rounds/hour)')
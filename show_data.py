@@ -1,5 +1,3 @@
-import json
-import os
 import pandas as pd
 import sys
 
@@ -222,11 +220,10 @@ def starting_hands(true_count=0):
 
 def val_data(row):
     d = row.state
-    if not os.path.isfile(d.fpath):
-        raise FileNotFoundError(d.fpath)
-    with open(d.fpath, 'r') as fp:
-        data = json.load(fp)
-    return data['valuation']
+    val = d.valuation_saved
+    if val is None:
+        raise LookupError(f'No saved valuation for {d}')
+    return val
 
 
 if __name__ == '__main__':
@@ -1,9 +1,8 @@
-import json
-import os
 import pandas as pd
 import sys
 
-from config import home_dir, log, pandas_format
+import compute
+from config import log, pandas_format
 from deal import Deal
 from rules import Rules
 
@@ -180,13 +179,10 @@ def dsort(row):
 
 
 def find_complete_true_counts(rules):
-    rule_dir = f'{home_dir}/states/{rules}'
     tcs = []
-    for tc_dir in os.listdir(rule_dir):
-        complete_fpath = f'{rule_dir}/{tc_dir}/{rules} {tc_dir} [] .json'
-        # log(f'Checking {complete_fpath}...')
-        if os.path.isfile(complete_fpath):
-            tc = float(tc_dir[2:])
+    for tc in compute.true_counts():
+        # log(f'Checking TC {tc}...')
+        if Deal(rules=rules.instreams, true_count=tc).valuation_is_saved:
             tcs.append(tc)
     log(f'Complete true counts {tcs}')
     return tcs
@@ -321,11 +317,10 @@ def starting_hands(rules, true_counts):
 
 def val_data(row):
     d = row.state
-    if not os.path.isfile(d.fpath):
-        raise FileNotFoundError(d.fpath)
-    with open(d.fpath, 'r') as fp:
-        data = json.load(fp)
-    return data['valuation']
+    val = d.valuation_saved
+    if val is None:
+        raise LookupError(f'No saved valuation for {d}')
+    return val
 
 
 def main(rules):
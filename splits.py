@@ -0,0 +1,95 @@
+"""Split hands valued directly, rather than by expanding them as Deal states.
+
+Splitting is modeled as one hand played out, its value multiplied by the number of hands (see Hand.new_hand):
+after a split, Player holds the split card alone, split_count tells how deep in resplits the hand is,
+and the split cards set aside count as out of the shoe (Shoe.cards_out). What happens to that hand from there
+depends only on the rules, the Dealer up card, the true count and which cards are out. So, as for the Dealer
+in dealer.py, it can be valued by a plain recursion over the cards drawn, without a Deal state per hand:
+    Each card drawn adds to the removed cards, which also fix the hand (removed less those out at the split).
+    A hand that stands, doubles, or reaches 21 is valued against dealer_probs for the removed cards then.
+    A bust loses the bet; actions are the Deal's, from HandTables, the best taken as Deal.valuation does.
+    Drawing a pair again, Split is the post-split hand one level deeper: same removed cards, split_count + 1,
+    valued by the same function (cached, up to a bound, as in shoe.py), so each resplit depth is valued once,
+    below the one before it.
+Values are exactly those of expanding the states, node counts included: the same hands, cards, actions
+and sums, taken in the same order.
+"""
+from functools import lru_cache
+
+from config import card_indexes, card_symbols, card_values
+from dealer import dealer_probs, dealer_totals
+from hand import hand_tables
+from rules import Rules
+from shoe import card_pdf
+
+
+@lru_cache(maxsize=1 << 16)
+def split_hand_valuation(rules, true_count, upcard, removed, split_card, split_count):
+    """Return (value, nodes) of a post-split hand holding split_card alone, split_count splits deep.
+        rules is Rules instreams; upcard the Dealer's up card symbol;
+        removed the 11-slot count of cards out of the shoe, as in Shoe.cards_out (split cards included).
+    """
+    r = Rules(*rules)
+    tables = hand_tables(rules)
+    decks = r.shoe_decks
+    split_aces = split_card == 'A'
+    payoffs = tables.payoffs
+    memo = {}
+
+    def stand(total, doubled, out):
+        probs = dealer_probs(r.hit_soft_17, decks, true_count, upcard, out)
+        pays = payoffs[doubled, split_count][min(total, 22)]
+        return sum(p * pays[min(t, 22)] for p, t in zip(probs, dealer_totals)), 1
+
+    def draws(out):
+        """Yield (prob, card index, removed after) for each card that can come next."""
+        for card, prob in card_pdf(decks, true_count, out).items():
+            if prob <= 0:
+                continue
+            i = card_indexes[card]
+            after = list(out)
+            after[i] += 1
+            yield prob, i, tuple(after)
+
+    def play(hard, aces, num_cards, pair, out):
+        total = hard + 10 if aces and hard <= 11 else hard
+        if total > 21:
+            return payoffs[False, split_count][22][17], 1
+        if total == 21:
+            return stand(total, False, out)
+        if out in memo:
+            return memo[out]
+        best = None
+        for action in tables.player_actions[total, total != hard, num_cards == 2, pair, split_count, split_aces]:
+            if action == 'Stand':
+                result = stand(total, False, out)
+            elif action == 'Split':
+                result = split_hand_valuation(rules, true_count, upcard, out, split_card, split_count + 1)
+            else:
+                value, nodes = 0.0, 0
+                for prob, i, after in draws(out):
+                    if action == 'Hit':
+                        v, n = play(hard + card_values[i], aces or card_symbols[i] == 'A', num_cards + 1, False, after)
+                    else:
+                        v, n = double(hard + card_values[i], aces or card_symbols[i] == 'A', after)
+                    value += prob * v
+                    nodes += n
+                result = value, nodes
+            if best is None or result[0] > best[0]:
+                best = result
+        memo[out] = best
+        return best
+
+    def double(hard, aces, out):
+        total = hard + 10 if aces and hard <= 11 else hard
+        if total > 21:
+            return payoffs[True, split_count][22][17], 1
+        return stand(total, True, out)
+
+    s = card_indexes[split_card]
+    value, nodes = 0.0, 0
+    for prob, i, after in draws(removed):
+        v, n = play(card_values[s] + card_values[i], split_aces or card_symbols[i] == 'A', 2, i == s, after)
+        value += prob * v
+        nodes += n
+    return value, nodes
@@ -0,0 +1,121 @@
+"""Compact integer encoding of a full Deal state: rules, true count, dealer hand and player hand.
+
+A key packs into 128 bits, high to low:
+    Rules                   13 bits     blackjack pays (2), decks - 1 (3), hit soft 17, double allowed (2),
+                                        splits allowed (2), double after split, resplit aces, late surrender
+    True count              13 bits     hundredths, offset so it's never negative
+    Dealer hand             51 bits     as below
+    Player hand             51 bits     as below
+Each hand packs card counts (4 bits per rank 2-T, 5 bits for As, 1 bit for the down card x),
+then surrendered, doubled and stand flags, split card (4 bits; 0 for none) and split count (2 bits).
+
+The key is what makes a Deal unique in the instance cache, and is what we store states by;
+key_name gives its fixed-width hex form, used for file names.
+"""
+from config import card_indexes, card_symbols
+
+
+blackjack_pays_values = (1.5, 1.2, 1.0, 2.0)
+double_allowed_values = ('Any2', '9-11', '10-11')
+count_bits = (4, 4, 4, 4, 4, 4, 4, 4, 4, 5, 1)
+hand_bits = sum(count_bits) + 3 + 4 + 2
+true_count_bits = 13
+true_count_offset = 1 << (true_count_bits - 1)
+
+
+def decode(key):
+    """Return the (rules, dealer, player, true_count) Deal arguments packed in key."""
+    player, key = _decode_hand(key & ((1 << hand_bits) - 1)), key >> hand_bits
+    dealer, key = _decode_hand(key & ((1 << hand_bits) - 1)), key >> hand_bits
+    true_count = ((key & ((1 << true_count_bits) - 1)) - true_count_offset) / 100.0
+    key >>= true_count_bits
+    late_surrender, key = bool(key & 1), key >> 1
+    resplit_aces, key = bool(key & 1), key >> 1
+    double_after_split, key = bool(key & 1), key >> 1
+    splits_allowed, key = key & 3, key >> 2
+    double_allowed, key = double_allowed_values[key & 3], key >> 2
+    hit_soft_17, key = bool(key & 1), key >> 1
+    shoe_decks, key = (key & 7) + 1, key >> 3
+    blackjack_pays = blackjack_pays_values[key & 3]
+    rules = (
+        blackjack_pays,
+        shoe_decks,
+        hit_soft_17,
+        double_allowed,
+        splits_allowed,
+        double_after_split,
+        resplit_aces,
+        late_surrender,
+    )
+    return rules, dealer, player, true_count
+
+
+def encode(rules, dealer, player, true_count=0):
+    """Pack Deal arguments (Rules and Hand instreams, plus true count) into a single integer key."""
+    blackjack_pays, shoe_decks, hit_soft_17, double_allowed, splits_allowed, das, rsa, late_surrender = rules
+    if not 1 <= shoe_decks <= 8 or not 0 <= splits_allowed <= 3:
+        raise ValueError(f'Rules out of range for state key: {rules}')
+    key = blackjack_pays_values.index(blackjack_pays)
+    key = key << 3 | (shoe_decks - 1)
+    key = key << 1 | bool(hit_soft_17)
+    key = key << 2 | double_allowed_values.index(double_allowed)
+    key = key << 2 | splits_allowed
+    key = key << 1 | bool(das)
+    key = key << 1 | bool(rsa)
+    key = key << 1 | bool(late_surrender)
+    tc = round(true_count * 100) + true_count_offset
+    if not 0 <= tc < 1 << true_count_bits:
+        raise ValueError(f'True count out of range for state key: {true_count}')
+    key = key << true_count_bits | tc
+    key = key << hand_bits | _encode_hand(dealer)
+    key = key << hand_bits | _encode_hand(player)
+    return key
+
+
+def group_key(key):
+    """Rules and true count part of a key: the states of one rules/true count run share it."""
+    return key >> (2 * hand_bits)
+
+
+def group_range(group):
+    """Lowest key in group, and lowest key above it."""
+    return group << (2 * hand_bits), (group + 1) << (2 * hand_bits)
+
+
+def key_name(key):
+    """Fixed-width hex representation of a key, e.g. for file names."""
+    return f'{key:032x}'
+
+
+def name_key(name):
+    return int(name, 16)
+
+
+def _decode_hand(key):
+    split_count, key = key & 3, key >> 2
+    split_index, key = key & 15, key >> 4
+    stand, key = bool(key & 1), key >> 1
+    doubled, key = bool(key & 1), key >> 1
+    surrendered, key = bool(key & 1), key >> 1
+    counts = []
+    for bits in reversed(count_bits):
+        counts.append(key & ((1 << bits) - 1))
+        key >>= bits
+    split_card = card_symbols[split_index - 1] if split_index else ''
+    return tuple(reversed(counts)), surrendered, split_card, split_count, doubled, stand
+
+
+def _encode_hand(hand):
+    counts, surrendered, split_card, split_count, doubled, stand = hand
+    key = 0
+    for count, bits in zip(counts, count_bits):
+        n = int(count)
+        if n != count or not 0 <= n < 1 << bits or not 0 <= split_count <= 3:
+            raise ValueError(f'Hand out of range for state key: {hand}')
+        key = key << bits | n
+    key = key << 1 | bool(surrendered)
+    key = key << 1 | bool(doubled)
+    key = key << 1 | bool(stand)
+    key = key << 4 | (card_indexes[split_card] + 1 if split_card else 0)
+    key = key << 2 | split_count
+    return key
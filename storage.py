@@ -0,0 +1,256 @@
+"""Where saved Deal states live: Deal.save, Deal.load and Deal.valuation_saved go through Deal.store.
+
+DirectoryStore is the original layout, one JSON file per state (see Deal.fpath).
+SqliteStore keeps every state in a single SQLite file, one row per state keyed by its 16-byte state key,
+so a lookup is a primary key read rather than a file open and parse.
+Writes are held and committed in batches of batch_size per transaction; call flush (or close)
+before a process ends other than normally, e.g. a pool worker, or held writes are lost.
+A store opens its connection lazily, per process, so a store set on Deal before starting workers
+is only used by them if their Deal.store is set the same way (spawned workers re-import this module).
+
+A slim store keeps only each state's valuation, not its children, shoe pdf or hand state.
+
+StateStore itself saves nothing, for runs whose states aren't wanted on disk.
+
+Whether a state is saved is answered from memory: the first check for a rules/true count run reads the keys
+of all its saved states (a directory walk, or a key range scan), and saves add to that set.
+States saved by other processes after that aren't seen; at worst, they're computed again here.
+
+WriteBehindStore wraps another store so that saves return at once and are written by a background thread,
+letting computation carry on meanwhile. It holds at most max_pending states queued (a save beyond that waits);
+a queued state reads back as saved, with the data queued. Queued states are all written by flush,
+which close (run at exit, including sys.exit) calls; a failed write is logged, and raised at the next flush.
+A process forked from the one that made it gets a queue and writer thread of its own.
+"""
+import atexit
+from functools import cached_property
+import json
+import os
+import queue
+import sqlite3
+import threading
+
+from config import home_dir, log
+from state_key import group_key, group_range, name_key
+
+
+class StateStore:
+    slim = False
+
+    def __init__(self):
+        self.index = {}         # Keys of saved states, by rules/true count group (see state_key.group_key)
+
+    def close(self):
+        self.flush()
+
+    def exists(self, deal):
+        return deal.key in self.indexed(deal)
+
+    def flush(self):
+        pass
+
+    def indexed(self, deal):
+        group = group_key(deal.key)
+        if group not in self.index:
+            # setdefault, in case a WriteBehindStore writer thread got there first
+            self.index.setdefault(group, self.saved_keys(deal))
+        return self.index[group]
+
+    def saved_keys(self, deal):
+        """Return set of keys of all saved states with the same rules and true count as deal.
+            Empty here, as this store persists nothing; a store that does reads them back here.
+        """
+        return set()
+
+    def load(self, deal):
+        return None
+
+    def save(self, deal, data, fpath=None):
+        pass
+
+
+class DirectoryStore(StateStore):
+    def load(self, deal):
+        if not self.exists(deal):
+            return None
+        try:
+            with open(deal.fpath, 'r') as fp:
+                return json.load(fp)
+        except json.decoder.JSONDecodeError as e:
+            log(f'ERROR: {deal.fpath} failed to load')
+            raise e
+
+    def save(self, deal, data, fpath=None):
+        """fpath: deal.fpath, if already resolved (as by WriteBehindStore, off its writer thread)."""
+        fpath = deal.fpath if fpath is None else fpath
+        os.makedirs(os.path.dirname(fpath), exist_ok=True)
+        with open(fpath, 'w') as fp:
+            json.dump(data, fp, indent=4)
+        self.indexed(deal).add(deal.key)
+
+    def saved_keys(self, deal):
+        keys = set()
+        for dirpath, dirnames, filenames in os.walk(deal.count_dir):
+            for f in filenames:
+                if len(f) == 37 and f.endswith('.json'):
+                    keys.add(name_key(f[:-5]))
+        return keys
+
+
+class SqliteStore(StateStore):
+    def __init__(self, fpath=f'{home_dir}/states.db', slim=True, batch_size=1000):
+        super().__init__()
+        self.fpath = fpath
+        self.slim = slim
+        self.batch_size = batch_size
+        self.pending = {}       # Serialized states not yet written, by key bytes
+        self.lock = threading.RLock()   # One connection, shared with a WriteBehindStore's writer thread
+
+    @cached_property
+    def conn(self):
+        os.makedirs(os.path.dirname(self.fpath), exist_ok=True)
+        conn = sqlite3.connect(self.fpath, timeout=60, check_same_thread=False)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        conn.execute('CREATE TABLE IF NOT EXISTS states (key BLOB PRIMARY KEY, data TEXT NOT NULL) WITHOUT ROWID')
+        atexit.register(self.close)
+        return conn
+
+    def close(self):
+        with self.lock:
+            if 'conn' not in self.__dict__:
+                return
+            self.flush()
+            self.conn.close()
+            del self.__dict__['conn']
+            atexit.unregister(self.close)
+
+    def flush(self):
+        with self.lock:
+            if not self.pending:
+                return
+            with self.conn:
+                self.conn.executemany('INSERT OR REPLACE INTO states (key, data) VALUES (?, ?)', self.pending.items())
+            self.pending = {}
+
+    def load(self, deal):
+        if not self.exists(deal):
+            return None
+        key = state_bytes(deal)
+        with self.lock:
+            if key in self.pending:
+                return json.loads(self.pending[key])
+            row = self.conn.execute('SELECT data FROM states WHERE key = ?', (key,)).fetchone()
+        if row is None:
+            return None
+        return json.loads(row[0])
+
+    def save(self, deal, data, fpath=None):
+        """fpath is ignored: rows are keyed by state key, not file path."""
+        with self.lock:
+            self.pending[state_bytes(deal)] = json.dumps(data)
+            self.indexed(deal).add(deal.key)
+            if len(self.pending) >= self.batch_size:
+                self.flush()
+
+    def saved_keys(self, deal):
+        low, high = (k.to_bytes(16, 'big') for k in group_range(group_key(deal.key)))
+        with self.lock:
+            rows = self.conn.execute('SELECT key FROM states WHERE key >= ? AND key < ?', (low, high)).fetchall()
+        return {int.from_bytes(key, 'big') for key, in rows}
+
+
+class WriteBehindStore:
+    def __init__(self, store, max_pending=1000, batch_size=100):
+        self.store = store
+        self.slim = store.slim
+        self.batch_size = batch_size
+        self.max_pending = max_pending
+        self.pending = {}       # Data queued and not yet written, by key
+        self.start()
+        atexit.register(self.close)
+
+    def close(self):
+        self.flush()
+        self.store.close()
+
+    def check_process(self):
+        """A process forked from this store's owner (e.g. a pool worker) inherits its queue, lock and writer,
+            but not the writer thread, so it starts its own; the owner writes what it had queued.
+        """
+        if self.pid != os.getpid():
+            self.start()
+
+    def start(self):
+        """Fresh queue and lock, with no writer thread yet."""
+        self.pid = os.getpid()
+        self.queue = queue.Queue(maxsize=self.max_pending)
+        self.lock = threading.Lock()
+        self.pending = dict(self.pending)
+        self.errors = []
+        self.writer = None
+
+    def exists(self, deal):
+        self.check_process()
+        with self.lock:
+            if deal.key in self.pending:
+                return True
+        return self.store.exists(deal)
+
+    def flush(self):
+        self.check_process()
+        if self.writer is not None:
+            self.queue.join()
+        if self.errors:
+            errors, self.errors = self.errors, []
+            raise RuntimeError(f'{len(errors)} state saves failed') from errors[0]
+        self.store.flush()
+
+    def load(self, deal):
+        self.check_process()
+        with self.lock:
+            if deal.key in self.pending:
+                return self.pending[deal.key]
+        return self.store.load(deal)
+
+    def save(self, deal, data):
+        self.check_process()
+        if self.writer is None:
+            self.writer = threading.Thread(target=self.write, name='state writer', daemon=True)
+            self.writer.start()
+        fpath = deal.fpath          # Resolved here, not on the writer thread
+        with self.lock:
+            self.pending[deal.key] = data
+        self.queue.put((deal, data, fpath))
+
+    def write(self):
+        """Writer thread: write queued states, batch_size at a time between store flushes."""
+        while True:
+            batch = [self.queue.get()]
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+            for deal, data, fpath in batch:
+                try:
+                    self.store.save(deal, data, fpath)
+                except Exception as e:
+                    log(f'ERROR: failed to save {deal}: {e!r}')
+                    self.errors.append(e)
+            try:
+                self.store.flush()
+            except Exception as e:
+                log(f'ERROR: failed to flush {len(batch)} states: {e!r}')
+                self.errors.append(e)
+            with self.lock:
+                for deal, data, fpath in batch:
+                    if self.pending.get(deal.key) is data:
+                        del self.pending[deal.key]
+            for item in batch:
+                self.queue.task_done()
+
+
+def state_bytes(deal):
+    """State key as 16 bytes, big-endian so keys sort as the integers do."""
+    return deal.key.to_bytes(16, 'big')
@@ -0,0 +1,37 @@
+"""Tests import the repo's top-level modules directly, as its scripts do.
+
+Each test gets a clean slate: an empty state cache and shared caches, and a DirectoryStore under a temporary
+home directory, so nothing is read from or written to a real run's saved states.
+"""
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import deal                                     # noqa: E402
+from node import CachedInstance                 # noqa: E402
+from storage import DirectoryStore              # noqa: E402
+
+
+# Rules as Rules instreams: those the series' baseline values were taken under, and some variations
+rules_h17 = (1.5, 6, True, 'Any2', 3, True, False, True)
+rules_s17 = (1.5, 2, False, 'Any2', 3, False, True, True)
+
+
+def clear_caches():
+    CachedInstance._instances.clear()
+    CachedInstance._hits.clear()
+    CachedInstance._candidates.clear()
+    for f in deal.shared_caches:
+        f.cache_clear()
+
+
+@pytest.fixture(autouse=True)
+def fresh_deals(tmp_path, monkeypatch):
+    monkeypatch.setattr(deal, 'home_dir', str(tmp_path))
+    monkeypatch.setattr(deal.Deal, 'store', DirectoryStore())
+    clear_caches()
+    yield
+    clear_caches()
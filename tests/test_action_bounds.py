@@ -0,0 +1,42 @@
+import pytest
+
+from conftest import clear_caches, rules_h17, rules_s17
+from deal import Deal, ValuationFrame
+
+
+def valuation(cards, rules, bound, monkeypatch, keep_runner_up=True):
+    clear_caches()
+    monkeypatch.setattr(Deal, 'decompose_splits', True)     # Split valued the same, only faster (see test_splits)
+    monkeypatch.setattr(Deal, 'bound_actions', bound)
+    monkeypatch.setattr(Deal, 'keep_runner_up', keep_runner_up)
+    monkeypatch.setattr(Deal, 'save_if_wanted', lambda self, val: None)     # Each run values its own states
+    return Deal.from_cards(cards, rules=rules).valuation
+
+
+@pytest.mark.parametrize('rules', [rules_h17, rules_s17])
+@pytest.mark.parametrize('cards, skipped', [('5T5x', 'Split'), ('7T7x', 'Split'), ('868x', 'Hit'), ('4T4x', 'Split')])
+def test_best_two_unchanged(rules, cards, skipped, monkeypatch):
+    """Bounded, the best two actions are as valued in full; those skipped are no better than their bounds."""
+    exact = valuation(cards, rules, False, monkeypatch)
+    bounded = valuation(cards, rules, True, monkeypatch)
+    assert [(v['action'], v['value']) for v in bounded[:2]] == [(v['action'], v['value']) for v in exact[:2]]
+    values = {v['action']: v['value'] for v in exact}
+    assert [v['action'] for v in bounded if v.get('bound')] == [skipped]
+    for v in bounded:
+        assert v['value'] >= values[v['action']] - 1e-12
+
+
+def test_subtree_skips_actions(monkeypatch):
+    """Over a subtree, many actions are skipped, and its value is unchanged."""
+    skipped = []
+    results = ValuationFrame.results
+
+    def counted(frame):
+        skipped.extend(a for a in frame.bounds if a not in frame.done)
+        return results(frame)
+
+    exact = valuation('T6', rules_h17, False, monkeypatch, keep_runner_up=False)
+    monkeypatch.setattr(ValuationFrame, 'results', counted)
+    bounded = valuation('T6', rules_h17, True, monkeypatch, keep_runner_up=False)
+    assert bounded[0]['value'] == exact[0]['value']
+    assert skipped.count('Hit') > 10 and 'Split' in skipped
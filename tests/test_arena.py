@@ -0,0 +1,29 @@
+import pytest
+
+from arena import Arena
+from conftest import clear_caches, rules_h17, rules_s17
+from deal import Deal
+
+
+@pytest.mark.parametrize('rules', [rules_h17, rules_s17])
+@pytest.mark.parametrize('cards', ['T66x', '5A6x', '868x', '2T'])
+def test_matches_deal_valuation(rules, cards):
+    clear_caches()
+    expected = Deal.from_cards(cards, rules=rules).valuation
+    clear_caches()
+    arena = Arena(capacity=16)          # Small, so arrays and index grow along the way
+    val = arena.valuation(arena.add(Deal.from_cards(cards, rules=rules)))
+    assert val == expected
+    assert all(type(v['value']) is float and type(v['nodes']) is int for v in val)
+    assert all(arena.find(arena.key(i))[0] == i for i in range(arena.size))
+
+
+def test_known_without_children():
+    """A state valued without child states has Deal's valuation, with an action (None for a leaf)."""
+    arena = Arena()
+    blackjack = Deal.from_cards('A6Tx', rules=rules_h17)
+    stood = Deal.from_cards('T6Tx', rules=rules_h17).new_deal(stand=True)
+    for d, action in [(blackjack, None), (stood, 'Turn')]:
+        val = arena.valuation(arena.add(d))
+        assert [v['action'] for v in val] == [action]
+        assert val[0]['value'] == d.valuation[0]['value']
@@ -0,0 +1,67 @@
+import pytest
+
+import checkpoint
+from checkpoint import Checkpoint
+from conftest import clear_caches, rules_h17
+from deal import Deal
+
+
+@pytest.fixture(autouse=True)
+def checkpointed(tmp_path, monkeypatch):
+    monkeypatch.setattr(checkpoint, 'home_dir', str(tmp_path))
+    monkeypatch.setattr(Deal, 'save_if_wanted', lambda self, val: None)     # Resumed from the checkpoint alone
+    yield
+    Deal.checkpoint = None
+
+
+def valuation(cards, min_nodes):
+    clear_caches()
+    root = Deal.from_cards(cards, rules=rules_h17)
+    Deal.checkpoint = Checkpoint(root, interval=1e9, min_nodes=min_nodes)
+    return root.valuation
+
+
+def test_keeps_frontier_only(monkeypatch):
+    """Of the states recorded, only those with no recorded state above them are kept: at the end, root's children,
+        and the children of those not recorded (valued in too few nodes).
+    """
+    recorded = []
+    record = Checkpoint.record
+
+    def counted(self, deal, val):
+        if max(v['nodes'] for v in val) >= self.min_nodes:
+            recorded.append(deal.key)
+        record(self, deal, val)
+
+    monkeypatch.setattr(Checkpoint, 'record', counted)
+    valuation('8T', 20)
+    kept = Deal.checkpoint.valuations
+    assert kept and set(kept) < set(recorded)
+    root = Deal.from_cards('8T', rules=rules_h17)
+    children = [child for action, card, prob, child in root.iter_next_states()]
+    frontier = {c.key for c in children} | {
+        g.key for c in children if c.key not in kept for action, card, prob, g in c.iter_next_states()
+    }
+    assert set(kept) <= frontier
+
+
+def test_resumes(monkeypatch):
+    """A run stopped part way, as for restart, resumes from its snapshot to the same valuation."""
+    expected = valuation('8T', 20)
+    Deal.checkpoint.remove()
+    calls = []
+    record = Checkpoint.record
+
+    def stopping(self, deal, val):
+        record(self, deal, val)
+        calls.append(deal.key)
+        if len(calls) == 300:
+            self.save()
+            raise SystemExit(0)
+
+    monkeypatch.setattr(Checkpoint, 'record', stopping)
+    with pytest.raises(SystemExit):
+        valuation('8T', 20)
+    assert Checkpoint(Deal.from_cards('8T', rules=rules_h17)).valuations
+    monkeypatch.setattr(Checkpoint, 'record', record)
+    assert valuation('8T', 20) == expected
@@ -0,0 +1,41 @@
+import pytest
+
+from conftest import rules_h17, rules_s17
+from deal import Deal
+from dealer import dealer_probs
+
+
+upcards = ['2', '3', '4', '5', '6', '7', '8', '9', 'T', 'A']
+
+
+def stood_value(player, upcard, rules, true_count):
+    """Value of Player standing on the two cards player against upcard; the state is released after."""
+    d = Deal.from_cards(player[0] + upcard + player[1] + 'x', rules=rules, true_count=true_count)
+    d = d.new_deal(stand=True)
+    value = d.valuation[0]['value']
+    d.release()
+    return value
+
+
+@pytest.mark.parametrize('rules', [rules_h17, rules_s17])
+@pytest.mark.parametrize('upcard', upcards)
+def test_matches_expanded_dealer_play(rules, upcard, monkeypatch):
+    """Value from dealer_probs is that of expanding Dealer play as child states."""
+    for player, true_count in [('T7', 0), ('T9', 2.3), ('64', -1.7)]:
+        direct = stood_value(player, upcard, rules, true_count)
+        monkeypatch.setattr(Deal, 'use_dealer_probs', False)
+        expanded = stood_value(player, upcard, rules, true_count)
+        monkeypatch.setattr(Deal, 'use_dealer_probs', True)
+        assert direct == pytest.approx(expanded, rel=1e-12, abs=1e-12)
+
+
+@pytest.mark.parametrize('hit_soft_17', [False, True])
+@pytest.mark.parametrize('upcard', upcards)
+def test_distribution(hit_soft_17, upcard):
+    """Probabilities of Dealer final totals are all possible, and sum to 1."""
+    removed = [0] * 11
+    removed[upcards.index(upcard)] = 1
+    probs = dealer_probs(hit_soft_17, 6, 0, upcard, tuple(removed))
+    assert len(probs) == 6
+    assert min(probs) > 0
+    assert sum(probs) == pytest.approx(1.0, abs=1e-12)
@@ -0,0 +1,25 @@
+import numpy as np
+import pytest
+
+from dealer import dealer_probs
+from dealer_batch import compositions_for, dealer_distributions
+
+
+upcards = ['2', '3', '4', '5', '6', '7', '8', '9', 'T', 'A']
+true_counts = [-3.0, -0.5, 0, 1.2, 4.0]
+
+
+@pytest.mark.parametrize('hit_soft_17', [False, True])
+@pytest.mark.parametrize('upcard', upcards)
+@pytest.mark.parametrize('decks, others', [(6, ''), (2, 'T7'), (1, 'AA5')])
+def test_matches_dealer_probs(hit_soft_17, upcard, decks, others):
+    """Each row is what dealer.dealer_probs gives for the same shoe, one at a time."""
+    removed = [0] * 11
+    for card in upcard + others:
+        removed[upcards.index(card)] += 1
+    removed = tuple(removed)
+    batch = dealer_distributions(compositions_for(decks, true_counts, removed), upcard, hit_soft_17)
+    assert batch.shape == (len(true_counts), 6)
+    for row, tc in zip(batch, true_counts):
+        expected = dealer_probs(hit_soft_17, decks, tc, upcard, removed)
+        np.testing.assert_allclose(row, expected, rtol=1e-12, atol=1e-14)
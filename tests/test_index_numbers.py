@@ -0,0 +1,15 @@
+import os
+
+from conftest import rules_h17
+from deal import Deal
+import index_numbers
+
+
+def test_probes_not_saved(tmp_path, monkeypatch):
+    """Index number probes value states without saving them (nor creating directories for them)."""
+    monkeypatch.setattr(Deal, 'store', Deal.store)      # Put back after, as hand_indexes sets its own
+    monkeypatch.setattr(Deal, 'node_save_threshold', 10)    # States worth saving, were they saved
+    res = index_numbers.hand_indexes(rules_h17, '16', 'T6', 'T', 2.0)
+    assert res['base'] == 'Surrender'
+    assert res['evaluations'] > 2
+    assert os.listdir(tmp_path) == []
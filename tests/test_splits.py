@@ -0,0 +1,40 @@
+import pytest
+
+from conftest import clear_caches, rules_h17, rules_s17
+from deal import Deal
+
+
+def valuation(cards, rules, true_count, decompose, monkeypatch):
+    clear_caches()
+    monkeypatch.setattr(Deal, 'decompose_splits', decompose)
+    return Deal.from_cards(cards, rules=rules, true_count=true_count).valuation
+
+
+@pytest.mark.parametrize('rules', [
+    rules_h17,
+    rules_s17,
+    (1.5, 6, False, 'Any2', 1, True, False, True),
+    (1.5, 1, True, 'Any2', 2, False, False, False),
+])
+@pytest.mark.parametrize('cards, true_count', [
+    ('8T8x', 0), ('A6Ax', 0), ('868x', 1.5), ('373x', -2.0), ('9T9x', 3.0), ('TTTx', 0),
+])
+def test_matches_full_expansion(rules, cards, true_count, monkeypatch):
+    """Decomposed split hands give exactly the values and node counts of expanding them as child states."""
+    expanded = valuation(cards, rules, true_count, False, monkeypatch)
+    decomposed = valuation(cards, rules, true_count, True, monkeypatch)
+    assert decomposed == expanded
+
+
+# Action values from the original code (before this series' changes), which expanded Dealer play as well
+baseline = {
+    '8T8x': {'Split': -0.4557113750639687, 'Surrender': -0.5, 'Hit': -0.5353941178920799, 'Stand': -0.536853299237752},
+    '9T9x': {'Stand': -0.17107971338972444, 'Split': -0.29072514244817993, 'Surrender': -0.5},
+}
+
+
+@pytest.mark.parametrize('decompose', [False, True])
+@pytest.mark.parametrize('cards', baseline)
+def test_matches_baseline(cards, decompose, monkeypatch):
+    values = {v['action']: v['value'] for v in valuation(cards, rules_h17, 0, decompose, monkeypatch)}
+    assert values == pytest.approx(baseline[cards], rel=1e-12)
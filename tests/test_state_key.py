@@ -0,0 +1,66 @@
+import pytest
+
+from conftest import rules_h17, rules_s17
+from deal import Deal
+from state_key import decode, encode, group_key, group_range, key_name, name_key
+
+
+no_hand = ((0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0), False, '', 0, False, False)
+
+
+@pytest.mark.parametrize('args', [
+    ((1.5, 6, False, 'Any2', 3, True, True, True), no_hand, no_hand, 0),
+    (rules_h17, ((0, 0, 0, 0, 0, 0, 0, 0, 1, 0, 1), False, '', 0, False, False),
+     ((0, 0, 0, 0, 1, 0, 0, 0, 1, 0, 0), True, '', 0, False, False), 2.5),
+    (rules_s17, ((0, 0, 0, 0, 0, 0, 0, 0, 0, 1, 1), False, '', 0, False, False),
+     ((0, 0, 0, 0, 0, 0, 1, 0, 1, 0, 0), False, '8', 3, True, False), -10.0),
+    ((1.2, 8, True, '10-11', 0, False, False, False), ((2, 1, 0, 0, 0, 0, 0, 0, 1, 0, 0), False, '', 0, False, True),
+     ((15, 0, 0, 0, 0, 0, 0, 0, 0, 16, 0), False, 'A', 1, False, True), 40.95),
+    ((1.0, 1, False, '9-11', 2, True, False, True), no_hand, no_hand, -40.96),
+])
+def test_round_trip(args):
+    assert decode(encode(*args)) == args
+
+
+def test_round_trip_split_hand_counts():
+    """Split hands have float counts (see Hand.new_hand); they pack as the ints they equal."""
+    player = ((0, 0, 0, 0, 0, 0, 1.0, 0, 1, 0, 0), False, '8', 1, False, False)
+    rules, dealer, decoded, tc = decode(encode(rules_h17, no_hand, player, 0))
+    assert decoded == ((0, 0, 0, 0, 0, 0, 1, 0, 1, 0, 0), False, '8', 1, False, False)
+
+
+def test_states_in_tree_round_trip():
+    """Every state of a subtree, split states included, is remade from its decoded key as the same state."""
+    root = Deal.from_cards('868x', rules=rules_h17, true_count=1.3)
+    todo, seen = [root], set()
+    while todo:
+        d = todo.pop()
+        if d.key in seen or d.next_actions is None or d.next_is_down_card_turn:
+            continue
+        seen.add(d.key)
+        rules, dealer, player, tc = decode(d.key)
+        assert Deal(rules=rules, dealer=dealer, player=player, true_count=tc) is d
+        todo.extend(child for action, card, prob, child in d.iter_next_states())
+    assert len(seen) > 100
+
+
+@pytest.mark.parametrize('args', [
+    ((1.5, 9, False, 'Any2', 3, True, True, True), no_hand, no_hand, 0),
+    ((1.5, 6, False, 'Any2', 4, True, True, True), no_hand, no_hand, 0),
+    ((1.5, 6, False, 'Any2', 3, True, True, True), no_hand, no_hand, 41),
+    ((1.5, 6, False, 'Any2', 3, True, True, True), no_hand, ((16, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0),) + no_hand[1:], 0),
+    ((1.5, 6, False, 'Any2', 3, True, True, True), no_hand, ((0.5, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0),) + no_hand[1:], 0),
+])
+def test_out_of_range(args):
+    with pytest.raises(ValueError):
+        encode(*args)
+
+
+def test_names_and_groups():
+    key = Deal.from_cards('T66x', rules=rules_h17, true_count=-2.2).key
+    assert name_key(key_name(key)) == key
+    assert len(key_name(key)) == 32
+    low, high = group_range(group_key(key))
+    assert low <= key < high
+    other = Deal.from_cards('T66x', rules=rules_h17, true_count=-2.1).key
+    assert group_key(other) != group_key(key)
@@ -0,0 +1,126 @@
+import os
+
+import pytest
+
+from conftest import rules_h17
+from deal import Deal, pool_job
+from storage import DirectoryStore, SqliteStore, StateStore, WriteBehindStore
+
+
+def directory(tmp_path):
+    return DirectoryStore()         # Under the temporary home directory (see conftest)
+
+
+def sqlite(tmp_path):
+    return SqliteStore(f'{tmp_path}/states.db', slim=False, batch_size=2)
+
+
+def behind_directory(tmp_path):
+    return WriteBehindStore(DirectoryStore(), batch_size=2)
+
+
+def behind_sqlite(tmp_path):
+    return WriteBehindStore(sqlite(tmp_path), batch_size=2)
+
+
+stores = [directory, sqlite, behind_directory, behind_sqlite]
+
+
+def states():
+    return [Deal.from_cards(cards, rules=rules_h17, true_count=tc) for cards in ['', 'T66x', '868x'] for tc in [0, -1.5]]
+
+
+@pytest.mark.parametrize('make_store', stores)
+def test_round_trip(make_store, tmp_path):
+    store = make_store(tmp_path)
+    saved = states()
+    for i, d in enumerate(saved):
+        assert not store.exists(d)
+        assert store.load(d) is None
+        store.save(d, {'summary': {'state': d.implied_name}, 'valuation': [{'action': 'Stand', 'value': i / 7}]})
+        assert store.exists(d)
+    for i, d in enumerate(saved):
+        assert store.load(d)['valuation'][0]['value'] == i / 7
+    store.flush()
+    for i, d in enumerate(saved):
+        assert store.load(d) == {'summary': {'state': d.implied_name}, 'valuation': [{'action': 'Stand', 'value': i / 7}]}
+    store.close()
+
+
+@pytest.mark.parametrize('make_store', stores)
+def test_reopened(make_store, tmp_path):
+    """A new store on the same files finds what was saved, by its saved keys, once flushed."""
+    store = make_store(tmp_path)
+    saved = states()
+    for i, d in enumerate(saved):
+        store.save(d, {'valuation': [{'value': i}]})
+    store.close()
+    again = make_store(tmp_path)
+    other = Deal.from_cards('T77x', rules=rules_h17)
+    assert not again.exists(other)
+    for i, d in enumerate(saved):
+        assert again.exists(d)
+        assert again.load(d) == {'valuation': [{'value': i}]}
+    again.close()
+
+
+def test_deal_save_through_store(tmp_path):
+    """Deal.save and Deal.valuation_saved go through Deal.store."""
+    Deal.store = behind_sqlite(tmp_path)
+    d = Deal.from_cards('T66x', rules=rules_h17)
+    d.save(save_valuation=True)
+    Deal.store.flush()
+    assert d.valuation_is_saved
+    assert d.valuation_saved == d.valuation
+    Deal.store.close()
+
+
+def test_base_store_saves_nothing():
+    assert StateStore().saved_keys(Deal.from_cards('T66x', rules=rules_h17)) == set()
+
+
+def test_pool_job_flushes_however_it_ends(tmp_path):
+    """Saves held by the store are written when a pool job ends, even by an exception."""
+    Deal.store = behind_sqlite(tmp_path)
+    d = Deal.from_cards('T66x', rules=rules_h17)
+
+    @pool_job
+    def job():
+        Deal.store.save(d, {'valuation': [{'value': 1}]})
+        raise SystemExit(0)
+
+    with pytest.raises(SystemExit):
+        job()
+    assert sqlite(tmp_path).load(d) == {'valuation': [{'value': 1}]}
+    Deal.store.close()
+
+
+def test_write_behind_in_forked_process(tmp_path):
+    """A forked process saves through its own writer thread, not the one it can't inherit."""
+    store = behind_sqlite(tmp_path)
+    d, other = Deal.from_cards('T66x', rules=rules_h17), Deal.from_cards('T77x', rules=rules_h17)
+    store.save(d, {'valuation': [{'value': 1}]})        # Writer thread started here
+    pid = os.fork()
+    if pid == 0:
+        try:
+            store.save(other, {'valuation': [{'value': 2}]})
+            store.flush()
+        finally:
+            os._exit(0)
+    os.waitpid(pid, 0)
+    store.close()
+    assert sqlite(tmp_path).load(other) == {'valuation': [{'value': 2}]}
+
+
+def test_save_leaves_no_children(monkeypatch):
+    """Saving a state in full names its children without leaving them in cache once released."""
+    monkeypatch.setattr(Deal, 'retain_finished', False)
+    d = Deal.from_cards('T66x', rules=rules_h17)
+    d.valuation
+    before = set(Deal._instances)
+    d.save(save_valuation=True)
+    Deal.store.flush()
+    assert set(Deal._instances) == before
+    children = Deal.store.load(d)['children']
+    assert children['Stand'] == {'<no card>': {'state': str(d.new_deal(stand=True)), 'prob': 1.0}}
+    assert len(children['Hit']) == 10
@@ -0,0 +1,71 @@
+import numpy as np
+import pytest
+
+from conftest import clear_caches
+from deal import Deal
+from rules import Rules
+from vector_valuation import BatchValuation, TrueCountValuation, as_valuations
+
+
+variants = [
+    (Rules(1.5, 6, True, 'Any2', 3, True, False, True), 0),
+    (Rules(1.5, 6, True, 'Any2', 3, True, False, True), 2.4),
+    (Rules(1.5, 2, False, 'Any2', 1, False, False, True), -1.0),
+    (Rules(1.5, 4, True, 'Any2', 2, False, True, False), 0),
+    (Rules(1.5, 6, False, 'Any2', 0, True, False, True), 5.0),
+]
+
+
+def deal_values(cards, rules, true_count):
+    """Deal.valuation of the state dealt as cards, by action, made from scratch.
+        Deal states offer Surrender whatever the rules; here it's dropped where late surrender isn't allowed.
+    """
+    clear_caches()
+    d = Deal.from_cards(cards, rules=rules.instreams, true_count=true_count)
+    return {v['action']: v['value'] for v in d.valuation if rules.late_surrender or v['action'] != 'Surrender'}
+
+
+@pytest.mark.parametrize('cards', ['T66x', '5A6x', '8T8x', '9T9x'])
+def test_matches_deal_valuation(cards):
+    batch = BatchValuation(variants)
+    res = batch.valuation(Deal.from_cards(cards, rules=batch.walk_rules.instreams))
+    valuations = as_valuations(res)
+    for (rules, tc), label in zip(variants, res['variants']):
+        expected = deal_values(cards, rules, tc)
+        got = {v['action']: v['value'] for v in valuations[label]}
+        assert got.keys() == expected.keys()
+        for action, value in expected.items():
+            assert got[action] == pytest.approx(value, rel=1e-9, abs=1e-12), (label, action)
+    assert not any(np.isinf(v).any() for v in batch.values.values())     # Masking leaves memoized values be
+
+
+def test_true_counts():
+    rules = variants[0][0]
+    tcs = [-2.0, 0, 1.5]
+    batch = TrueCountValuation(rules, tcs)
+    res = batch.valuation(Deal.from_cards('T66x', rules=rules.instreams))
+    for tc, value, best in zip(tcs, res['value'], res['best']):
+        expected = deal_values('T66x', rules, tc)
+        assert value == pytest.approx(max(expected.values()), rel=1e-9, abs=1e-12)
+        assert best == max(expected, key=expected.get)
+
+
+def test_late_surrender():
+    """Variants differing only in late surrender differ where Surrender is best."""
+    batch = BatchValuation([(Rules(late_surrender=True), 0), (Rules(late_surrender=False), 0)])
+    res = batch.valuation(Deal.from_cards('TT6x', rules=batch.walk_rules.instreams))
+    assert res['best'] == ['Surrender', 'Hit']
+    assert res['actions']['Surrender'].tolist() == [-0.5, -np.inf]
+
+
+def test_memo_limit(monkeypatch):
+    """With few value vectors kept, states are valued again as needed, to the same values."""
+    rules = BatchValuation(variants).walk_rules.instreams
+    full = BatchValuation(variants).valuation(Deal.from_cards('5A6x', rules=rules))
+    monkeypatch.setattr(BatchValuation, 'memo_limit', 20)
+    batch = BatchValuation(variants)
+    res = batch.valuation(Deal.from_cards('5A6x', rules=rules))
+    assert len(batch.values) <= 20 and len(batch.dealer_probs) <= 20
+    assert res['nodes'] > full['nodes']
+    for action, val in full['actions'].items():
+        np.testing.assert_array_equal(res['actions'][action], val)
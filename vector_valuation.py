@@ -0,0 +1,245 @@
+"""Value a Deal state under many variants (rules and true count) in a single pass through its tree.
+
+The decision tree below a state has the same shape at every true count; only the shoe composition,
+and so the card probabilities, differ. So rather than one full run per true count, we walk the tree once
+with each node's value held as a NumPy vector, one element per variant:
+    Card probabilities are vectors, from the shoe composition of each variant less the cards out
+    Chance levels take the probability-weighted sum of child value vectors
+    Action levels take the elementwise max across actions, noting the best action for each variant
+    Dealer play is valued from dealer_batch.dealer_distributions, all variants at once
+The Deal objects walked give the tree's shape, at whatever true count they were created with;
+a card is followed if it has positive probability in any of the variants.
+
+Most rules change the tree only in a few places, so rule sets can share a walk too:
+    Blackjack payout changes only the Blackjack leaf values
+    Hitting soft 17 changes only the Dealer distributions
+    Deck count changes only the shoe compositions
+    Splits allowed, double after split and resplit aces remove Split or Double at some Player states
+    Late surrender removes Surrender (which Deal states offer whatever the rule; here the rule is followed)
+The tree is walked under rules permitting everything any variant permits (walk_rules),
+and at each Player state an action a variant's rules don't allow is masked out of that variant's max.
+States reached only through such actions get values for every variant, but they carry no weight where masked.
+Value vectors of states valued are kept for reuse (transpositions), up to memo_limit, least recently used dropped first.
+"""
+import sys
+
+import numpy as np
+
+from config import card_symbols, log
+from deal import Deal
+from dealer import dealer_totals
+from dealer_batch import compositions_for, dealer_distributions
+from rules import Rules
+
+
+class BatchValuation:
+    memo_limit = 1 << 20    # Most value vectors, and Dealer distributions, kept for reuse
+
+    def __init__(self, variants):
+        """variants: list of (Rules, true count)"""
+        self.variants = list(variants)
+        self.base = np.array([compositions_for(r.shoe_decks, [tc])[0] for r, tc in self.variants])
+        self.blackjack_pays = np.array([r.blackjack_pays for r, tc in self.variants])
+        self.walk_rules = walk_rules([r for r, tc in self.variants])
+        self.rule_rows = {}     # Rules, and indexes of variants using them, by Rules instreams
+        for i, (r, tc) in enumerate(self.variants):
+            self.rule_rows.setdefault(r.instreams, (r, []))[1].append(i)
+        self.values = {}        # Value vector by state key, for states already valued
+        self.dealer_probs = {}  # Dealer final total probabilities by up card and cards out
+        self.nodes = 0
+
+    @property
+    def labels(self):
+        return [(r.implied_name, tc) for r, tc in self.variants]
+
+    def action_values(self, deal):
+        """Return dict of value vectors, by action, for Player (or Dealer) choosing each action at this state.
+            Where a variant's rules don't allow an action, its value for that variant is -inf.
+        """
+        results = {}
+        for action in deal.next_actions:
+            if action in ['Deal', 'Turn', 'Double', 'Hit']:
+                doubled = True if action == 'Double' else None
+                val = np.zeros(len(self.variants))
+                for card, prob in self.card_probs(deal).items():
+                    if not prob.any():
+                        continue
+                    val += prob * self.value(deal.new_deal(card, doubled=doubled))
+            elif action == 'Surrender':
+                # Copied: a single child's value is the vector memoized in self.values, and may be masked below
+                val = self.value(deal.new_deal(surrendered=True)).copy()
+            elif action == 'Split':
+                val = self.value(deal.new_deal(split=True)).copy()
+            elif action == 'Stand':
+                val = self.value(deal.new_deal(stand=True)).copy()
+            else:
+                raise ValueError(f'Bad action "{action}"')
+            results[action] = val
+        if 'Split' in results or 'Double' in results or 'Surrender' in results:
+            for r, rows in self.rule_rows.values():
+                allowed = deal.next_hand.actions_under(r)
+                for action in results:
+                    if action not in allowed:
+                        results[action][rows] = -np.inf
+        return results
+
+    def card_probs(self, deal):
+        """Return dict of probability vectors, by next card, as in Deal.next_card_pdf for each variant."""
+        comps = self.compositions(deal)
+        num_cards = comps[:, :10].sum(axis=1)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            pdf = np.where(num_cards[:, None] != 0, comps[:, :10] / num_cards[:, None], 0.0)
+        pdf = dict(zip(card_symbols, pdf.T))
+        if deal.next_is_down_card_deal:
+            if deal.dealer.cards == 'T':
+                pdf = {
+                    'A': pdf['A'],
+                    'x': 1 - pdf['A'],
+                }
+            elif deal.dealer.cards == 'A':
+                pdf = {
+                    'T': pdf['T'],
+                    'x': 1 - pdf['T'],
+                }
+            else:
+                pdf = {
+                    'x': np.ones(len(self.variants)),
+                }
+        elif deal.next_is_down_card_turn:
+            excluded = {'T': 'A', 'A': 'T'}.get(deal.dealer.cards[0])
+            if excluded:
+                adj_factor = pdf.pop(excluded)
+                pdf = {c: p / (1 - adj_factor) for c, p in pdf.items()}
+        return {c: np.where(p > 0, p, 0.0) for c, p in pdf.items()}
+
+    def compositions(self, deal):
+        """Shoe composition of each variant less the cards out; a variant with fewer decks than the tree walked
+            may have none of some card left (and the state can't be reached in that variant).
+        """
+        return np.maximum(self.base - np.array(deal.shoe.removed, dtype=float), 0)
+
+    def dealer_value(self, deal):
+        upcard = deal.dealer.cards[0]
+        key = upcard, deal.shoe.removed
+        probs = recall(self.dealer_probs, key)
+        if probs is None:
+            comps = self.compositions(deal)
+            probs = np.zeros((len(self.variants), len(dealer_totals)))
+            for hit_soft_17 in (False, True):
+                rows = [i for i, (r, tc) in enumerate(self.variants) if r.hit_soft_17 == hit_soft_17]
+                if rows:
+                    probs[rows] = dealer_distributions(comps[rows], upcard, hit_soft_17)
+            remember(self.dealer_probs, key, probs, self.memo_limit)
+        payoffs = np.array([deal.player.value_against(t) for t in dealer_totals])
+        return probs @ payoffs
+
+    def leaf_value(self, deal):
+        if deal.player.outcome == 'Blackjack':
+            return self.blackjack_pays.copy()
+        return np.full(len(self.variants), deal.valuation_leaf['value'])
+
+    def valuation(self, deal):
+        """Return valuation of deal's hands for each variant:
+            'actions': dict of value vectors by action (-inf where not allowed)
+            'value': vector of best action value
+            'best': list of best action for each variant
+        """
+        if deal.rules.instreams != self.walk_rules.instreams:
+            deal = Deal(
+                rules=self.walk_rules.instreams,
+                dealer=deal.dealer.instreams,
+                player=deal.player.instreams,
+                true_count=deal.shoe.true_count,
+            )
+        actions = self.action_values(deal)
+        names = list(actions.keys())
+        vals = np.array([actions[a] for a in names])
+        return {
+            'variants': self.labels,
+            'actions': actions,
+            'value': vals.max(axis=0),
+            'best': [names[i] for i in vals.argmax(axis=0)],
+            'nodes': self.nodes,
+        }
+
+    def value(self, deal):
+        """Value vector of deal, with best allowed action taken in each variant."""
+        val = recall(self.values, deal.key)
+        if val is not None:
+            deal.release()
+            return val
+        self.nodes += 1
+        if deal.valuation_leaf is not None:
+            val = self.leaf_value(deal)
+        elif deal.next_is_down_card_turn:
+            val = self.dealer_value(deal)
+        else:
+            val = np.max(list(self.action_values(deal).values()), axis=0)
+        remember(self.values, deal.key, val, self.memo_limit)
+        deal.release()
+        return val
+
+
+class TrueCountValuation(BatchValuation):
+    """One set of rules at many true counts."""
+    def __init__(self, rules, true_counts):
+        self.rules = rules
+        self.true_counts = list(true_counts)
+        super().__init__([(rules, tc) for tc in self.true_counts])
+
+    @property
+    def labels(self):
+        return self.true_counts
+
+
+def as_valuations(result):
+    """Return dict, by variant label, of valuations in Deal.valuation format (allowed actions sorted best first)."""
+    valuations = {}
+    for i, label in enumerate(result['variants']):
+        val = [
+            {'action': a, 'value': v[i], 'nodes': result['nodes']}
+            for a, v in result['actions'].items() if v[i] > -np.inf
+        ]
+        valuations[label] = sorted(val, key=lambda r: r['value'], reverse=True)
+    return valuations
+
+
+def recall(memo, key):
+    """Return memo's entry for key (None if none), moving it to the end, as most recently used."""
+    val = memo.pop(key, None)
+    if val is not None:
+        memo[key] = val
+    return val
+
+
+def remember(memo, key, val, limit):
+    """Add val to memo, dropping the least recently used entry (the first) if that takes it over limit."""
+    memo[key] = val
+    if len(memo) > limit:
+        del memo[next(iter(memo))]
+
+
+def walk_rules(rules):
+    """Rules under which the tree walked includes every state reachable under any of rules."""
+    return Rules(
+        blackjack_pays=rules[0].blackjack_pays,
+        shoe_decks=max(r.shoe_decks for r in rules),
+        hit_soft_17=rules[0].hit_soft_17,
+        double_allowed=rules[0].double_allowed,
+        splits_allowed=max(r.splits_allowed for r in rules),
+        double_after_split=any(r.double_after_split for r in rules),
+        resplit_aces=any(r.resplit_aces for r in rules),
+        late_surrender=any(r.late_surrender for r in rules),
+    )
+
+
+if __name__ == '__main__':
+    from compute import rules_to_run
+
+    cards = sys.argv[1] if len(sys.argv) > 1 else ''
+    tc = float(sys.argv[2]) if len(sys.argv) > 2 else 0
+    batch = BatchValuation([(r, tc) for r in rules_to_run()])
+    d = Deal.from_cards(cards, rules=batch.walk_rules.instreams, true_count=tc)
+    res = batch.valuation(d)
+    for (rules, tc), best, value in zip(res['variants'], res['best'], res['value']):
+        log(f'{rules} TC{tc:+.1f} {d.dealer} {d.player}: {best} {value:+.6f}')